@@ -0,0 +1,428 @@
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+import personal_assistant as pa
+import instrumentation
+from storage import ConflictError
+from csv_export import write_csv, export_changes
+from note_bodies import NoteStore, compact as compact_bodies
+from calculator import evaluate
+from finance_index import date_ordinal, format_money
+from task_query import Status, Priority, Due, And, Or, run_query, overdue
+
+# Неинтерактивный режим: одна команда из аргументов или поток команд
+# JSON Lines на stdin, все команды выполняются над одним состоянием в
+# памяти, а на диск оно пишется один раз в конце (или каждые
+# --checkpoint команд). Ответ на каждую команду — строка JSON.
+#
+#   python assistant_cli.py tasks add --title "Купить хлеб" --due 01-02-2025
+#   python assistant_cli.py finance report --start 01-01-2025 --end 31-01-2025
+#   python assistant_cli.py batch --checkpoint 1000 < commands.jsonl
+#
+# Строка потока: {"command": "tasks finish", "id": 5}
+
+PRIORITIES = ['Высокий', 'Средний', 'Низкий']
+REPOS = [pa.notes_repo, pa.tasks_repo, pa.contacts_repo, pa.finance_repo]
+COMMANDS = {}
+
+
+class Arg:
+    # kind: обычный тип (str, int, float), 'flag' или 'list'
+    def __init__(self, name, kind=str, required=False, default=None):
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.default = default
+
+    def convert(self, value):
+        if self.kind == 'flag':
+            return bool(value)
+        if self.kind == 'list':
+            return [value] if isinstance(value, str) else list(value)
+        return self.kind(value)
+
+
+def command(name, *args):
+    def register(func):
+        COMMANDS[name] = (func, args)
+        return func
+    return register
+
+
+def check_date(text):
+    try:
+        datetime.strptime(text, '%d-%m-%Y')
+    except (TypeError, ValueError):
+        raise ValueError(f"неверный формат даты: {text}") from None
+    return text
+
+
+def check_priority(priority):
+    if priority not in PRIORITIES:
+        raise ValueError(f"неверный приоритет: {priority}")
+    return priority
+
+
+def require(repo, record_id, what):
+    record = repo.get(record_id)
+    if record is None:
+        raise ValueError(f"{what} {record_id} не найдена")
+    return record
+
+
+def export(repo, columns, name, file_name, changes):
+    # изменения, сделанные раньше в том же потоке команд, сначала
+    # записываются, чтобы попасть в выгрузку изменений
+    repo.flush()
+    fields = [column for column, _ in columns]
+    if changes:
+        exported, deleted = export_changes(file_name, repo, fields, pa.EXPORT_CHECKPOINT.format(name))
+        return {'exported': exported, 'deleted': deleted}
+    return {'exported': write_csv(file_name, repo.iter(), fields)}
+
+
+@command('notes add', Arg('title', required=True), Arg('content', default=''))
+def notes_add(title, content):
+    note = pa.Notes(pa.notes_repo.next_id(), title, content, datetime.now().strftime('%d-%m-%Y %H:%M:%S'))
+    pa.notes_repo.put(note)
+    return note.to_dict()
+
+
+@command('notes list')
+def notes_list():
+    return [note.to_dict() for note in pa.notes_repo.iter()]
+
+
+@command('notes export', Arg('file', required=True), Arg('changes', 'flag'))
+def notes_export(file, changes):
+    return export(pa.notes_repo, pa.NOTE_CSV, 'notes', file, changes)
+
+
+@command('notes get', Arg('id', int, required=True))
+def notes_get(id):
+    return require(pa.notes_repo, id, "заметка").to_dict()
+
+
+@command('notes update', Arg('id', int, required=True), Arg('title'), Arg('content'))
+def notes_update(id, title, content):
+    note = require(pa.notes_repo, id, "заметка")
+    if title is not None:
+        note.title = title
+    if content is not None:
+        note.content = content
+    note.timestamp = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+    pa.notes_repo.put(note)
+    return note.to_dict()
+
+
+@command('notes delete', Arg('id', int, required=True))
+def notes_delete(id):
+    return {'deleted': pa.notes_repo.delete(id)}
+
+
+@command('notes search', Arg('query', required=True), Arg('limit', int, default=20))
+def notes_search(query, limit):
+    return [{'id': note_id, 'score': round(score, 4)}
+            for note_id, score in pa.notes_index.search(query, limit)]
+
+
+@command('notes compact')
+def notes_compact():
+    # освобождает место, занятое прежними текстами изменённых и удалённых заметок
+    if not isinstance(pa.notes_repo.store, NoteStore):
+        raise ValueError("тексты заметок хранятся отдельно только в режимах json и journal")
+    before, after = compact_bodies(pa.notes_repo)
+    return {'before': before, 'after': after}
+
+
+@command('tasks add', Arg('title', required=True), Arg('description', default=''),
+         Arg('priority', default='Средний'), Arg('due', required=True))
+def tasks_add(title, description, priority, due):
+    task = pa.Tasks(pa.tasks_repo.next_id(), title, description, False,
+                    check_priority(priority), check_date(due))
+    pa.tasks_repo.put(task)
+    return task.to_dict()
+
+
+@command('tasks list')
+def tasks_list():
+    return [task.to_dict() for task in pa.tasks_repo.iter()]
+
+
+@command('tasks export', Arg('file', required=True), Arg('changes', 'flag'))
+def tasks_export(file, changes):
+    return export(pa.tasks_repo, pa.TASK_CSV, 'tasks', file, changes)
+
+
+@command('tasks finish', Arg('id', int, required=True))
+def tasks_finish(id):
+    task = require(pa.tasks_repo, id, "задача")
+    task.finished = True
+    pa.tasks_repo.put(task)
+    return task.to_dict()
+
+
+@command('tasks update', Arg('id', int, required=True), Arg('title'), Arg('description'),
+         Arg('priority'), Arg('due'))
+def tasks_update(id, title, description, priority, due):
+    task = require(pa.tasks_repo, id, "задача")
+    if title is not None:
+        task.short_description = title
+    if description is not None:
+        task.long_description = description
+    if priority is not None:
+        task.priority = check_priority(priority)
+    if due is not None:
+        task.deadline = check_date(due)
+    pa.tasks_repo.put(task)
+    return task.to_dict()
+
+
+@command('tasks delete', Arg('id', int, required=True))
+def tasks_delete(id):
+    return {'deleted': pa.tasks_repo.delete(id)}
+
+
+@command('tasks filter', Arg('status'), Arg('priority', 'list'), Arg('overdue', 'flag'),
+         Arg('due_from'), Arg('due_to'), Arg('sort'), Arg('limit', int), Arg('offset', int, default=0))
+def tasks_filter(status, priority, overdue_only, due_from, due_to, sort, limit, offset):
+    parts = []
+    if status is not None:
+        parts.append(Status(status == 'Выполнена'))
+    if priority:
+        parts.append(Or(*(Priority(p) for p in priority)))
+    if overdue_only:
+        parts.append(overdue())
+    if due_from is not None or due_to is not None:
+        parts.append(Due(date_ordinal(check_date(due_from)) if due_from is not None else None,
+                         date_ordinal(check_date(due_to)) if due_to is not None else None))
+    if sort not in (None, 'deadline', 'priority'):
+        raise ValueError(f"неизвестная сортировка: {sort}")
+    where = And(*parts) if parts else None
+    return [task.to_dict() for task in run_query(pa.task_index, where, sort, limit, offset)]
+
+
+@command('contacts add', Arg('name', required=True), Arg('phone', default=''), Arg('email', default=''))
+def contacts_add(name, phone, email):
+    contact = pa.Contacts(pa.contacts_repo.next_id(), name, phone, email)
+    pa.contacts_repo.put(contact)
+    return contact.to_dict()
+
+
+@command('contacts list')
+def contacts_list():
+    return [contact.to_dict() for contact in pa.contacts_repo.iter()]
+
+
+@command('contacts export', Arg('file', required=True), Arg('changes', 'flag'))
+def contacts_export(file, changes):
+    return export(pa.contacts_repo, pa.CONTACT_CSV, 'contacts', file, changes)
+
+
+@command('contacts find', Arg('query', required=True), Arg('limit', int))
+def contacts_find(query, limit):
+    contacts = map(pa.contacts_repo.get, pa.contacts_index.search(query, limit))
+    return [contact.to_dict() for contact in contacts if contact is not None]
+
+
+@command('contacts update', Arg('id', int, required=True), Arg('name'), Arg('phone'), Arg('email'))
+def contacts_update(id, name, phone, email):
+    contact = require(pa.contacts_repo, id, "запись контакта")
+    if name is not None:
+        contact.name = name
+    if phone is not None:
+        contact.phone = phone
+    if email is not None:
+        contact.email = email
+    pa.contacts_repo.put(contact)
+    return contact.to_dict()
+
+
+@command('contacts delete', Arg('id', int, required=True))
+def contacts_delete(id):
+    return {'deleted': pa.contacts_repo.delete(id)}
+
+
+@command('finance add', Arg('amount', float, required=True), Arg('category', required=True),
+         Arg('date', required=True), Arg('description', default=''))
+def finance_add(amount, category, date, description):
+    record = pa.FinanceRecord(pa.finance_repo.next_id(), amount, category, check_date(date), description)
+    pa.finance_repo.put(record)
+    return record.to_dict()
+
+
+@command('finance list')
+def finance_list():
+    return [record.to_dict() for record in pa.finance_repo.iter()]
+
+
+@command('finance export', Arg('file', required=True), Arg('changes', 'flag'))
+def finance_export(file, changes):
+    return export(pa.finance_repo, pa.FINANCE_CSV, 'finance', file, changes)
+
+
+@command('finance update', Arg('id', int, required=True), Arg('amount', float), Arg('category'), Arg('date'),
+         Arg('description'))
+def finance_update(id, amount, category, date, description):
+    record = require(pa.finance_repo, id, "финансовая запись")
+    if amount is not None:
+        record.amount = amount
+    if category is not None:
+        record.category = category
+    if date is not None:
+        record.date = check_date(date)
+    if description is not None:
+        record.description = description
+    pa.finance_repo.put(record)
+    return record.to_dict()
+
+
+@command('finance delete', Arg('id', int, required=True))
+def finance_delete(id):
+    return {'deleted': pa.finance_repo.delete(id)}
+
+
+@command('finance report', Arg('start', required=True), Arg('end', required=True))
+def finance_report(start, end):
+    count, income, expense = pa.finance_totals().period_totals(date_ordinal(check_date(start)),
+                                                             date_ordinal(check_date(end)))
+    return {'count': count, 'income': format_money(income), 'expense': format_money(expense),
+            'balance': format_money(income + expense)}
+
+
+@command('finance balance')
+def finance_balance():
+    return {'balance': format_money(pa.finance_totals().balance())}
+
+
+@command('calc', Arg('expression', required=True))
+def calc(expression):
+    return {'result': evaluate(expression)}
+
+
+def bind(name, values):
+    # (функция команды, позиционные параметры) после проверки и приведения типов
+    if name not in COMMANDS:
+        raise ValueError(f"неизвестная команда: {name}")
+    func, args = COMMANDS[name]
+    params = []
+    for arg in args:
+        value = values.get(arg.name)
+        if value is None:
+            if arg.required:
+                raise ValueError(f"не указан параметр {arg.name}")
+            params.append(arg.default)
+        else:
+            params.append(arg.convert(value))
+    return func, params
+
+
+def execute(name, values):
+    func, params = bind(name, values)
+    return func(*params)
+
+
+def respond(out, name, values):
+    started = time.perf_counter()
+    try:
+        reply = {'ok': True, 'result': execute(name, values)}
+    except (ValueError, TypeError, ZeroDivisionError) as e:
+        reply = {'ok': False, 'error': str(e) or type(e).__name__}
+    if instrumentation.stats.enabled:
+        instrumentation.stats.record(name, time.perf_counter() - started)
+    if 'ref' in values:
+        reply['ref'] = values['ref']
+    out.write(json.dumps(reply, ensure_ascii=False) + '\n')
+    return reply['ok']
+
+
+def flush():
+    # False, если часть изменений не записана из-за конфликта с другим сеансом
+    ok = True
+    for repo in REPOS:
+        try:
+            repo.flush()
+        except ConflictError as e:
+            print(f"Не сохранено: {e}", file=sys.stderr)
+            ok = False
+    pa.notes_index.flush()
+    return ok
+
+
+def run_stream(lines, out, checkpoint=None):
+    # строки вида {"command": "...", параметры...}; необязательный "ref"
+    # возвращается в ответе, чтобы сопоставить его с запросом
+    failed = 0
+    done = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            values = json.loads(line)
+            name = values.pop('command')
+        except (ValueError, KeyError, AttributeError, TypeError):
+            out.write(json.dumps({'ok': False, 'error': f"строка {number}: неверный формат команды"},
+                                 ensure_ascii=False) + '\n')
+            failed += 1
+            continue
+        if not respond(out, name, values):
+            failed += 1
+        done += 1
+        if checkpoint and done % checkpoint == 0 and not flush():
+            failed += 1
+    return failed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Персональный ассистент: пакетный режим")
+    parser.add_argument('--stats', action='store_true', help="собрать статистику и вывести её при выходе")
+    groups = parser.add_subparsers(dest='group', required=True)
+    batch = groups.add_parser('batch', help="команды JSON Lines из stdin")
+    batch.add_argument('--checkpoint', type=int, default=None,
+                       help="сохранять изменения каждые N команд")
+    subparsers = {}
+    for name, (_, args) in COMMANDS.items():
+        group, _, action = name.partition(' ')
+        if not action:
+            target = groups.add_parser(group)
+        else:
+            if group not in subparsers:
+                subparsers[group] = groups.add_parser(group).add_subparsers(dest='action', required=True)
+            target = subparsers[group].add_parser(action)
+        for arg in args:
+            option = '--' + arg.name.replace('_', '-')
+            if arg.kind == 'flag':
+                target.add_argument(option, dest=arg.name, action='store_true')
+            elif arg.kind == 'list':
+                target.add_argument(option, dest=arg.name, nargs='+')
+            else:
+                target.add_argument(option, dest=arg.name, required=arg.required)
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    if args.pop('stats') or instrumentation.requested([]):
+        instrumentation.enable()
+    for repo in REPOS:
+        repo.defer()
+    failed = 0
+    try:
+        if args['group'] == 'batch':
+            failed = run_stream(sys.stdin, sys.stdout, args['checkpoint'])
+        else:
+            group = args.pop('group')
+            action = args.pop('action', None)
+            name = group if action is None else f'{group} {action}'
+            failed = 0 if respond(sys.stdout, name, args) else 1
+    finally:
+        if not flush():
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import personal_assistant as pa
+from assistant_cli import COMMANDS, bind
+from calculator import evaluate
+from storage import ConflictError
+
+# Режим сервиса: команды assistant_cli.py по JSON-RPC 2.0 поверх HTTP/1.1.
+# Все соединения работают с одной загруженной в память копией данных.
+#
+#   python assistant_server.py --port 8765 --workers 4
+#   curl -d '{"jsonrpc": "2.0", "id": 1, "method": "tasks filter",
+#             "params": {"overdue": true}}' http://127.0.0.1:8765/rpc
+#
+# Команды выполняются в цикле событий по порядку поступления, так что
+# чтение идёт прямо по данным в памяти, а изменения одной коллекции
+# применяются строго друг за другом. Репозитории работают в отложенном
+# режиме: изменение сразу видно остальным запросам, а на диск изменения
+# коллекции уходят общей записью (Committer) в отдельном потоке, и ответ на
+# запрос с изменением отправляется только после неё. Пока идёт запись,
+# чтение коллекции обслуживается из памяти и диска не ждёт, а изменения,
+# выгрузка и компакция этой коллекции ждут конца записи. Вычисления
+# калькулятора выполняются в пуле процессов ограниченного размера.
+#
+# Соединение держится открытым (keep-alive), запросы можно слать не
+# дожидаясь ответов: до PIPELINE_DEPTH запросов выполняются одновременно,
+# ответы уходят в порядке запросов.
+
+HOST = '127.0.0.1'
+PORT = 8765
+PIPELINE_DEPTH = 64
+MAX_BODY = 1 << 20
+COMMIT_DELAY = 0.001
+WRITE_ACTIONS = {'add', 'update', 'delete', 'finish'}
+# команды, которым не нужно ждать записи коллекции на диск
+READ_ACTIONS = {'list', 'get', 'search', 'filter', 'find', 'report', 'balance'}
+# команда -> (функция для пула процессов, оформление результата)
+POOLED = {'calc': (evaluate, lambda value: {'result': value})}
+DOMAINS = {'notes': pa.notes_repo, 'tasks': pa.tasks_repo, 'contacts': pa.contacts_repo,
+           'finance': pa.finance_repo}
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+COMMAND_ERROR = -32000
+CONFLICT = -32001
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large'}
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(STATUS_TEXT[status])
+        self.status = status
+
+
+class Committer:
+    # Групповая запись изменений одной коллекции: запросы, пришедшие за
+    # COMMIT_DELAY, ждут одной записи. Если прошлая запись шла дольше
+    # (в режиме json снимок переписывается целиком), группа собирается
+    # столько же: перезаписей снимка меньше, и процессор остаётся чтению.
+    # При конфликте с другим процессом ошибку получают только запросы,
+    # менявшие конфликтные записи.
+    def __init__(self, repo, delay, writer):
+        self.repo = repo
+        self.delay = delay
+        self.writer = writer
+        self.elapsed = 0
+        self.waiters = []
+        self.task = None
+        # держится, пока идёт запись; команды, меняющие коллекцию, ждут его
+        self.writing = asyncio.Lock()
+
+    async def commit(self, record_ids):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((future, record_ids))
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        await future
+
+    async def run(self):
+        await asyncio.sleep(max(self.delay, self.elapsed))
+        waiters, self.waiters = self.waiters, []
+        self.task = None
+        try:
+            await self.flush()
+            conflicts = set()
+        except ConflictError as e:
+            conflicts = set(e.record_ids)
+        except Exception as e:
+            for future, _ in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, record_ids in waiters:
+            if future.done():
+                # клиент отключился, не дождавшись ответа
+                continue
+            if conflicts & record_ids:
+                future.set_exception(ConflictError(conflicts & record_ids))
+            else:
+                future.set_result(None)
+
+    async def flush(self):
+        # Запись идёт в потоке по снимку коллекции. Отложенные изменения
+        # остаются в repo.pending до её конца, поэтому репозиторий тем
+        # временем не перечитывает файлы, и чтение идёт по памяти.
+        repo = self.repo
+        async with self.writing:
+            if not repo.pending:
+                return
+            changed, deleted = repo.pending_changes()
+            started = time.perf_counter()
+            written = await asyncio.get_running_loop().run_in_executor(
+                self.writer, repo.commit_unmerged, list(repo.items.values()), changed, deleted)
+            self.elapsed = time.perf_counter() - started
+            if written:
+                repo.flushed(set())
+            else:
+                # файлы менял другой процесс: слияние здесь же, в цикле событий
+                repo.flush()
+
+    def close(self):
+        try:
+            self.repo.flush()
+        except ConflictError as e:
+            print(f"Не сохранено: {e}", file=sys.stderr)
+
+
+def written_ids(result):
+    if isinstance(result, dict) and 'deleted' in result:
+        return set(result['deleted'])
+    if isinstance(result, dict) and 'id' in result:
+        return {result['id']}
+    return set()
+
+
+class Server:
+    def __init__(self, workers, commit_delay=COMMIT_DELAY):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        # очередь в пул ограничена, чтобы поток вычислений не копился в памяти
+        self.pool_slots = asyncio.Semaphore(workers * 4)
+        # записи коллекций идут по очереди в одном потоке
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.committers = {domain: Committer(repo, commit_delay, self.writer)
+                           for domain, repo in DOMAINS.items()}
+        # открытые соединения: задача обработчика -> writer
+        self.connections = {}
+
+    def warm_up(self):
+        for repo in DOMAINS.values():
+            repo.defer()
+            repo.load()
+
+    async def call(self, method, params):
+        if method not in COMMANDS:
+            raise RpcError(METHOD_NOT_FOUND, f"неизвестный метод: {method}")
+        func, args = bind(method, params)
+        if method in POOLED:
+            pooled, wrap = POOLED[method]
+            async with self.pool_slots:
+                return wrap(await asyncio.get_running_loop().run_in_executor(self.pool, pooled, *args))
+        domain, _, action = method.partition(' ')
+        if action in READ_ACTIONS:
+            result = func(*args)
+        else:
+            async with self.committers[domain].writing:
+                result = func(*args)
+        if action in WRITE_ACTIONS:
+            await self.committers[domain].commit(written_ids(result))
+        return result
+
+    async def handle_rpc(self, message):
+        # ответ на один объект JSON-RPC; None для уведомления (без id)
+        if not isinstance(message, dict) or not isinstance(message.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None,
+                    'error': {'code': INVALID_REQUEST, 'message': "неверный запрос"}}
+        params = message.get('params') or {}
+        try:
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_REQUEST, "params должен быть объектом")
+            reply = {'result': await self.call(message['method'], params)}
+        except RpcError as e:
+            reply = {'error': {'code': e.code, 'message': str(e)}}
+        except ConflictError as e:
+            reply = {'error': {'code': CONFLICT, 'message': str(e), 'data': e.record_ids}}
+        except (ValueError, TypeError, ZeroDivisionError) as e:
+            reply = {'error': {'code': COMMAND_ERROR, 'message': str(e) or type(e).__name__}}
+        except Exception as e:
+            print(f"Ошибка в {message['method']}: {e!r}", file=sys.stderr)
+            reply = {'error': {'code': INTERNAL_ERROR, 'message': "внутренняя ошибка сервера"}}
+        if 'id' not in message:
+            return None
+        return {'jsonrpc': '2.0', 'id': message['id'], **reply}
+
+    async def respond(self, method, path, body):
+        if path != '/rpc':
+            raise HttpError(404)
+        if method != 'POST':
+            raise HttpError(405)
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': "неверный JSON"}}
+        if isinstance(message, list):
+            if not message:
+                return {'jsonrpc': '2.0', 'id': None,
+                        'error': {'code': INVALID_REQUEST, 'message': "пустой пакет"}}
+            replies = await asyncio.gather(*(self.handle_rpc(item) for item in message))
+            return [reply for reply in replies if reply is not None] or None
+        return await self.handle_rpc(message)
+
+    async def reply(self, method, path, body):
+        # (статус, тело ответа) — ошибки HTTP не рвут соединение
+        try:
+            reply = await self.respond(method, path, body)
+        except HttpError as e:
+            return e.status, json.dumps({'error': str(e)}).encode('utf-8')
+        if reply is None:
+            return 204, b''
+        return 200, json.dumps(reply, ensure_ascii=False).encode('utf-8')
+
+    async def handle_connection(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        responses = asyncio.Queue(PIPELINE_DEPTH)
+        sender = asyncio.ensure_future(send_responses(responses, writer))
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await responses.put((complete(e.status, json.dumps({'error': str(e)}).encode('utf-8')), False))
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                # задача стартует сразу, очередь лишь задаёт порядок ответов
+                await responses.put((asyncio.ensure_future(self.reply(method, path, body)), keep_alive))
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+            del self.connections[asyncio.current_task()]
+
+    async def disconnect(self):
+        # закрытие соединений: обработчики дочитывают конец потока, отправляют
+        # ответы на уже принятые запросы и завершаются сами
+        tasks = list(self.connections)
+        for writer in self.connections.values():
+            writer.transport.abort()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        for committer in self.committers.values():
+            committer.close()
+        pa.notes_index.flush()
+        self.pool.shutdown()
+        self.writer.shutdown()
+
+
+def complete(status, body):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result((status, body))
+    return future
+
+
+async def read_request(reader):
+    # (метод, путь, тело, keep-alive) или None, если клиент закрыл соединение
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400) from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        raise HttpError(411)
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400) from None
+    if length > MAX_BODY:
+        raise HttpError(413)
+    body = await reader.readexactly(length)
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+    return method, path, body, keep_alive
+
+
+async def send_responses(responses, writer):
+    while True:
+        item = await responses.get()
+        if item is None:
+            return
+        task, keep_alive = item
+        status, body = await task
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        try:
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+async def serve(host, port, workers, commit_delay):
+    server = Server(workers, commit_delay)
+    server.warm_up()
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    stop = asyncio.get_running_loop().create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        except NotImplementedError:
+            # Windows: Ctrl+C прерывает asyncio.run, и изменения сохраняет finally
+            break
+    print(f"Сервер слушает http://{host}:{port}/rpc", file=sys.stderr, flush=True)
+    try:
+        async with listener:
+            await stop
+            listener.close()
+            await server.disconnect()
+    finally:
+        server.close()
+        print("Сервер остановлен, изменения сохранены.", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Персональный ассистент: JSON-RPC сервер")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=2, help="процессов для вычислений калькулятора")
+    parser.add_argument('--commit-delay', type=float, default=COMMIT_DELAY * 1000,
+                        help="сколько миллисекунд собирать изменения перед записью на диск")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers, args.commit_delay / 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import io
+import os
+import sys
+import json
+import math
+import glob
+import time
+import shutil
+import builtins
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+import bench_data
+
+# Бенчмарки горячих путей ассистента на синтетических данных bench_data.
+# Каждый размер прогоняется в отдельном процессе во временном каталоге,
+# функции интерфейса вызываются с подставленными ответами вместо input().
+# Для каждого случая записывается лучшее время из --repeat прогонов и
+# пиковая память (tracemalloc) отдельным прогоном.
+#
+#   python bench.py --sizes 1000,10000,100000 --out results.json
+#   python bench.py --compare old.json new.json
+#
+# Режим хранения берётся из ASSISTANT_STORAGE, как и в самом приложении.
+
+DEFAULT_SIZES = '1000,10000,100000'
+THRESHOLD = 1.25
+
+
+def drive(fn, *answers):
+    answers = iter(answers)
+    saved = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+    finally:
+        builtins.input = saved
+
+
+def make_cases(pa):
+    # [(имя, подготовка, замеряемый вызов)]; подготовка не замеряется
+    cases = []
+    collections = [
+        ('notes', pa.notes_repo, pa.load_notes, pa.save_notes, pa.export_notes_csv, pa.import_notes_csv),
+        ('tasks', pa.tasks_repo, pa.load_tasks, pa.save_tasks, pa.export_tasks_csv, pa.import_tasks_csv),
+        ('contacts', pa.contacts_repo, pa.load_contacts, pa.save_contacts, pa.export_contacts_csv,
+         pa.import_contacts_csv),
+        ('finance', pa.finance_repo, pa.load_finance, pa.save_finance, pa.export_finance_csv,
+         pa.import_finance_csv),
+    ]
+    for name, repo, load, save, export, import_ in collections:
+        loaded = []
+
+        def load_all(load=load, loaded=loaded):
+            loaded[:] = load()
+        cases.append((f'load_{name}', repo.invalidate, load_all))
+        cases.append((f'save_{name}', None, lambda save=save, loaded=loaded: save(loaded)))
+        cases.append((f'export_{name}_csv', None, lambda export=export, name=name: drive(export, f'export_{name}.csv', 'нет')))
+
+        def clear(save=save, name=name):
+            save([])
+            for path in glob.glob(f'{name}.csv.progress'):
+                os.remove(path)
+        cases.append((f'import_{name}_csv', clear, lambda import_=import_, name=name: drive(import_, f'{name}.csv')))
+
+    cases += [
+        ('find_contact_cold', pa.contacts_repo.invalidate, lambda: drive(pa.find_contact, 'Иван')),
+        ('find_contact_name', None, lambda: drive(pa.find_contact, 'Смирнова')),
+        ('find_contact_phone', None, lambda: drive(pa.find_contact, '915) 12')),
+        ('find_contact_email', None, lambda: drive(pa.find_contact, 'yandex')),
+        ('filter_tasks_cold', pa.tasks_repo.invalidate, lambda: drive(pa.filter_tasks, '2', 'Высокий', 'q')),
+        ('filter_tasks_overdue', None, lambda: drive(pa.filter_tasks, '4', 'q')),
+        ('filter_tasks_combined', None, lambda: drive(pa.filter_tasks, '7', 'Не выполнена', 'Высокий, Средний',
+                                                      'нет', '01-01-2022', '31-12-2022', '1', '50', '0', 'q')),
+        ('finance_report_cold', pa.finance_repo.invalidate,
+         lambda: drive(pa.generate_finance_report, '01-01-2021', '31-12-2021')),
+        ('finance_report', None, lambda: drive(pa.generate_finance_report, '01-03-2022', '30-06-2023')),
+        ('calc_total_balance', None, lambda: drive(pa.calc_total_balance)),
+    ]
+    return cases
+
+
+def measure(setup, run, repeat, memory):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+    return {'time': best, 'peak': peak}
+
+
+def run_worker(size, seed, repeat, memory, only):
+    # один размер в отдельном процессе: свежие кэши и индексы
+    workdir = tempfile.mkdtemp(prefix='assistant-bench-')
+    cwd = os.getcwd()
+    pa = None
+    try:
+        os.chdir(workdir)
+        for collection in bench_data.GENERATORS:
+            bench_data.write_json(collection, f'{collection}_data.json', size, seed)
+            bench_data.write_csv(collection, f'{collection}.csv', size, seed)
+        import personal_assistant as pa
+        results = {}
+        for name, setup, run in make_cases(pa):
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = measure(setup, run, repeat, memory)
+            print(f"  {name:<24}{results[name]['time'] * 1000:>12.2f} мс", file=sys.stderr)
+        return results
+    finally:
+        if pa is not None:
+            # индекс заметок пишется сейчас, а не при выходе в чужой каталог
+            pa.notes_index.flush()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def exponent(points):
+    # наклон log(время)/log(размер) между крайними размерами: ~1 — линейный рост
+    points = [(size, value) for size, value in points if value]
+    if len(points) < 2:
+        return None
+    (n1, t1), (n2, t2) = points[0], points[-1]
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def print_table(results, sizes):
+    header = f"{'случай':<24}" + ''.join(f"{size:>12}" for size in sizes) + f"{'рост':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, by_size in results.items():
+        row = f"{name:<24}"
+        points = []
+        for size in sizes:
+            entry = by_size.get(str(size))
+            row += f"{entry['time'] * 1000:>10.2f}мс" if entry else f"{'—':>12}"
+            points.append((size, entry and entry['time']))
+        slope = exponent(points)
+        print(row + (f"{slope:>7.2f}" if slope is not None else ''))
+
+
+def run_all(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {}
+    for size in sizes:
+        print(f"Размер {size}:", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--seed', str(args.seed),
+                   '--repeat', str(args.repeat)]
+        if args.no_memory:
+            command.append('--no-memory')
+        if args.only:
+            command += ['--only', args.only]
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, env=env).stdout
+        for name, entry in json.loads(output).items():
+            results.setdefault(name, {})[str(size)] = entry
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'storage': os.environ.get('ASSISTANT_STORAGE', 'json'),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'sizes': sizes,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_table(results, sizes)
+    print(f"\nРезультаты записаны в {args.out}")
+
+
+def compare(old_path, new_path, threshold):
+    # время нового прогона относительно старого; > threshold — регрессия
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old_report = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new_report = json.load(f)
+    for key in ('storage', 'python', 'seed'):
+        if old_report['meta'].get(key) != new_report['meta'].get(key):
+            print(f"Внимание: прогоны различаются ({key}: {old_report['meta'].get(key)} и "
+                  f"{new_report['meta'].get(key)})")
+    old, new = old_report['results'], new_report['results']
+    regressions = 0
+    for name in sorted(set(old) & set(new)):
+        for size in sorted(set(old[name]) & set(new[name]), key=int):
+            before, after = old[name][size]['time'], new[name][size]['time']
+            ratio = after / before if before else float('inf')
+            mark = ''
+            if ratio > threshold:
+                mark = '  РЕГРЕССИЯ'
+                regressions += 1
+            elif ratio < 1 / threshold:
+                mark = '  ускорение'
+            print(f"{name:<24}{size:>10}{before * 1000:>12.2f}{after * 1000:>12.2f} мс  x{ratio:.2f}{mark}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки персонального ассистента")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="размеры через запятую, от 1000 до 10000000")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="не замерять пиковую память")
+    parser.add_argument('--only', help="только случаи, содержащие одну из подстрок (через запятую)")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+    if args.worker:
+        only = args.only.split(',') if args.only else None
+        results = run_worker(args.worker, args.seed, args.repeat, not args.no_memory, only)
+        json.dump(results, sys.stdout)
+        return 0
+    run_all(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import os
+import csv
+import random
+import argparse
+from datetime import date
+
+from storage import write_json_array
+
+# Воспроизводимый генератор данных для бенчмарков: при одинаковых seed и
+# размере получаются одни и те же заметки, задачи, контакты и операции.
+# Записи выдаются по одной, так что файлы на 10M записей пишутся потоком.
+#
+#   python bench_data.py --size 100000 --seed 1 --out data/
+
+WORDS = ('встреча план отчёт проект задача звонок письмо бюджет покупка ремонт поездка '
+         'врач школа договор оплата счёт подарок книга идея заметка список магазин '
+         'молоко хлеб машина квартира работа отпуск семья друзья праздник спорт '
+         'python база данных сервер релиз тест документ презентация клиент').split()
+FIRST_NAMES = ('Александр Алексей Анна Валентина Дмитрий Евгений Екатерина Елена Иван '
+               'Игорь Мария Михаил Наталья Николай Ольга Павел Сергей Светлана Татьяна Юлия').split()
+LAST_NAMES = ('Иванов Смирнов Кузнецов Попов Васильев Петров Соколов Михайлов Новиков '
+              'Фёдоров Морозов Волков Алексеев Лебедев Семёнов Егоров Павлов Козлов').split()
+TRANSLIT = dict(zip('абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+                    ['a', 'b', 'v', 'g', 'd', 'e', 'e', 'zh', 'z', 'i', 'y', 'k', 'l', 'm', 'n', 'o',
+                     'p', 'r', 's', 't', 'u', 'f', 'kh', 'ts', 'ch', 'sh', 'sch', '', 'y', '', 'e',
+                     'yu', 'ya']))
+DOMAINS = ('mail.ru', 'yandex.ru', 'gmail.com', 'example.org')
+PRIORITIES = ('Высокий', 'Средний', 'Низкий')
+INCOME_CATEGORIES = ('Зарплата', 'Подработка', 'Проценты')
+EXPENSE_CATEGORIES = ('Продукты', 'Транспорт', 'Кафе', 'Связь', 'Жильё', 'Здоровье',
+                      'Одежда', 'Развлечения', 'Подарки', 'Образование')
+START = date(2020, 1, 1).toordinal()
+DAYS = 6 * 365
+
+FIELDS = {
+    'notes': ['id', 'title', 'content', 'timestamp'],
+    'tasks': ['id', 'title', 'description', 'done', 'priority', 'due_date'],
+    'contacts': ['id', 'name', 'phone', 'email'],
+    'finance': ['id', 'amount', 'category', 'date', 'description'],
+}
+
+
+def day(rng):
+    return date.fromordinal(START + rng.randrange(DAYS)).strftime('%d-%m-%Y')
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def transliterate(text):
+    return ''.join(TRANSLIT.get(char, char) for char in text.lower())
+
+
+def notes(count, seed=0):
+    rng = random.Random(f'notes-{seed}')
+    for i in range(1, count + 1):
+        stamp = f"{day(rng)} {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+        yield {'id': i, 'title': sentence(rng, 1, 4).capitalize(),
+               'content': sentence(rng, 5, 60).capitalize() + '.', 'timestamp': stamp}
+
+
+def tasks(count, seed=0):
+    rng = random.Random(f'tasks-{seed}')
+    for i in range(1, count + 1):
+        yield {'id': i, 'title': sentence(rng, 1, 3).capitalize(), 'description': sentence(rng, 0, 15),
+               'done': rng.random() < 0.4, 'priority': rng.choices(PRIORITIES, (2, 5, 3))[0],
+               'due_date': day(rng)}
+
+
+def contacts(count, seed=0):
+    rng = random.Random(f'contacts-{seed}')
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        if first.endswith('а') or first.endswith('я'):
+            last += 'а'
+        phone = f"+7 ({rng.randint(900, 999)}) {rng.randrange(1000):03d}-{rng.randrange(100):02d}-{rng.randrange(100):02d}"
+        email = f"{transliterate(first)}.{transliterate(last)}{i}@{rng.choice(DOMAINS)}"
+        yield {'id': i, 'name': f'{first} {last}', 'phone': phone, 'email': email}
+
+
+def finance(count, seed=0):
+    rng = random.Random(f'finance-{seed}')
+    for i in range(1, count + 1):
+        if rng.random() < 0.15:
+            category = rng.choice(INCOME_CATEGORIES)
+            amount = round(rng.uniform(5000, 150000), 2)
+        else:
+            category = rng.choice(EXPENSE_CATEGORIES)
+            amount = -round(rng.lognormvariate(6, 1.2), 2)
+        yield {'id': i, 'amount': amount, 'category': category, 'date': day(rng),
+               'description': sentence(rng, 0, 6)}
+
+
+GENERATORS = {'notes': notes, 'tasks': tasks, 'contacts': contacts, 'finance': finance}
+
+
+def write_json(collection, path, count, seed=0):
+    write_json_array(path, GENERATORS[collection](count, seed))
+
+
+def write_csv(collection, path, count, seed=0):
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDS[collection])
+        writer.writeheader()
+        writer.writerows(GENERATORS[collection](count, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор тестовых данных")
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--csv', action='store_true', help="писать CSV вместо *_data.json")
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    for collection in GENERATORS:
+        if args.csv:
+            write_csv(collection, os.path.join(args.out, f'{collection}.csv'), args.size, args.seed)
+        else:
+            write_json(collection, os.path.join(args.out, f'{collection}_data.json'), args.size, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import sys
+import tracemalloc
+
+import bench_data
+from personal_assistant import Notes, Tasks, Contacts, FinanceRecord
+
+# Замер памяти на одну запись: записи строятся из словарей, как при
+# загрузке из JSON, а для сравнения используются прежние классы
+# с __dict__ и без интернирования строк.
+# Запуск: python bench_memory.py [число записей]
+
+
+class PlainRecord:
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def plain_note(data):
+    return PlainRecord(id=data['id'], title=data['title'], content=data['content'],
+                       timestamp=data['timestamp'])
+
+
+def plain_task(data):
+    return PlainRecord(id=data['id'], short_description=data['title'],
+                       long_description=data['description'], finished=data['done'],
+                       priority=data['priority'], deadline=data['due_date'])
+
+
+def plain_contact(data):
+    return PlainRecord(id=data['id'], name=data['name'], phone=data['phone'], email=data['email'])
+
+
+def plain_finance(data):
+    return PlainRecord(id=data['id'], amount=data['amount'], category=data['category'],
+                       date=data['date'], description=data['description'])
+
+
+def copy_str(text):
+    # json.load создаёт для каждого значения отдельный объект строки
+    return (text + '.')[:-1]
+
+
+def make_dicts(count, seed=0):
+    return {name: list(bench_data.GENERATORS[collection](count, seed))
+            for name, collection in (('Notes', 'notes'), ('Tasks', 'tasks'),
+                                     ('Contacts', 'contacts'), ('FinanceRecord', 'finance'))}
+
+
+def resident(make, rows):
+    # память, которую записи занимают после освобождения исходных словарей
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [make(dict((key, copy_str(value) if isinstance(value, str) else value)
+                         for key, value in row.items())) for row in rows]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return (after - before) / len(rows)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_dicts(count)
+    pairs = [
+        ('Notes', plain_note, Notes.from_dict),
+        ('Tasks', plain_task, Tasks.from_dict),
+        ('Contacts', plain_contact, Contacts.from_dict),
+        ('FinanceRecord', plain_finance, FinanceRecord.from_dict),
+    ]
+    print(f"Записей каждого типа: {count}")
+    print(f"{'Тип':<15}{'было, байт':>12}{'стало, байт':>13}{'экономия':>10}")
+    for name, plain, compact in pairs:
+        rows = data[name]
+        old = resident(plain, rows)
+        new = resident(compact, rows)
+        print(f"{name:<15}{old:>12.0f}{new:>13.0f}{(1 - new / old) * 100:>9.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import threading
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import deque
+
+import bench_data
+
+# Нагрузка на assistant_server.py: несколько соединений, в каждом до
+# --depth запросов в полёте (pipelining), смесь чтения, изменений и
+# вычислений. Сервер запускается во временном каталоге с данными
+# bench_data, если не указан --connect. Печатает пропускную способность и
+# задержки (p50/p95/p99) по видам запросов.
+#
+#   python bench_server.py --size 10000 --connections 16 --depth 8 --requests 20000
+
+PORT = 8799
+# (вид, доля, генератор (метод, параметры))
+MIX = [
+    ('чтение', 0.70, lambda rng, size: rng.choice([
+        ('tasks filter', {'overdue': True, 'priority': ['Высокий'], 'sort': 'deadline', 'limit': 20}),
+        ('contacts find', {'query': rng.choice(bench_data.LAST_NAMES)[:5], 'limit': 10}),
+        ('finance report', {'start': f'01-{rng.randint(1, 12):02d}-2021', 'end': '31-12-2022'}),
+        ('finance balance', {}),
+        ('notes get', {'id': rng.randint(1, size)}),
+    ])),
+    ('запись', 0.20, lambda rng, size: rng.choice([
+        ('notes add', {'title': 'нагрузка', 'content': 'текст ' * rng.randint(1, 20)}),
+        ('tasks add', {'title': 'нагрузка', 'priority': 'Низкий', 'due': '01-01-2030'}),
+        ('finance add', {'amount': -rng.randint(1, 5000), 'category': 'Кафе', 'date': '01-06-2024'}),
+        ('notes update', {'id': rng.randint(1, size), 'content': 'обновлено'}),
+    ])),
+    ('вычисление', 0.10, lambda rng, size: (
+        'calc', {'expression': f'({rng.randint(1, 10**6)} ** 3 + {rng.randint(1, 999)}) / 7 - 2 ** 40'})),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def read_response(reader):
+    status = await reader.readline()
+    if not status:
+        raise ConnectionError("сервер закрыл соединение")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return int(status.split()[1]), await reader.readexactly(length)
+
+
+async def connection(host, port, requests, depth, size, seed, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random(seed)
+    kinds = [kind for kind, _, _ in MIX]
+    weights = [weight for _, weight, _ in MIX]
+    makers = {kind: maker for kind, _, maker in MIX}
+    in_flight = deque()
+    slots = asyncio.Semaphore(depth)
+
+    async def receive():
+        for _ in range(requests):
+            status, body = await read_response(reader)
+            kind, started = in_flight.popleft()
+            latencies[kind].append(time.perf_counter() - started)
+            slots.release()
+            if status != 200 or 'error' in json.loads(body):
+                errors.append(body[:200])
+
+    receiver = asyncio.ensure_future(receive())
+    for number in range(requests):
+        await slots.acquire()
+        kind = rng.choices(kinds, weights)[0]
+        method, params = makers[kind](rng, size)
+        body = json.dumps({'jsonrpc': '2.0', 'id': number, 'method': method, 'params': params},
+                          ensure_ascii=False).encode('utf-8')
+        in_flight.append((kind, time.perf_counter()))
+        writer.write(f"POST /rpc HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+    await receiver
+    writer.close()
+
+
+async def load(host, port, connections, depth, requests, size, seed):
+    latencies = {kind: [] for kind, _, _ in MIX}
+    errors = []
+    per_connection = requests // connections
+    started = time.perf_counter()
+    await asyncio.gather(*(connection(host, port, per_connection, depth, size, f'{seed}-{number}',
+                                      latencies, errors)
+                           for number in range(connections)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def start_server(workdir, size, seed, workers):
+    for collection in bench_data.GENERATORS:
+        bench_data.write_json(collection, os.path.join(workdir, f'{collection}_data.json'), size, seed)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            'assistant_server.py'),
+                               '--port', str(PORT), '--workers', str(workers)],
+                              cwd=workdir, env=env, stderr=subprocess.PIPE, text=True)
+    started = time.perf_counter()
+    line = server.stderr.readline()
+    if 'слушает' not in line:
+        server.kill()
+        raise SystemExit(f"сервер не запустился: {line}{server.stderr.read()}")
+    # дальнейший вывод сервера (ошибки) не должен заполнить канал и остановить его
+    threading.Thread(target=shutil.copyfileobj, args=(server.stderr, sys.stderr), daemon=True).start()
+    print(f"Сервер запущен за {time.perf_counter() - started:.2f} с ({size} записей в коллекции)")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест JSON-RPC сервера")
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--depth', type=int, default=8, help="запросов в полёте на соединение")
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--connect', help="HOST:PORT уже запущенного сервера")
+    args = parser.parse_args()
+    server = workdir = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        port = int(port)
+    else:
+        host, port = '127.0.0.1', PORT
+        workdir = tempfile.mkdtemp(prefix='assistant-server-')
+        server = start_server(workdir, args.size, args.seed, args.workers)
+    try:
+        elapsed, latencies, errors = asyncio.run(load(host, port, args.connections, args.depth,
+                                                      args.requests, args.size, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} запросов за {elapsed:.2f} с: {total / elapsed:.0f} запросов/с "
+          f"({args.connections} соединений, глубина {args.depth})")
+    print(f"{'вид':<12}{'запросов':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for kind, values in list(latencies.items()) + [('все', sum(latencies.values(), []))]:
+        print(f"{kind:<12}{len(values):>10}{percentile(values, 0.5) * 1000:>10.2f}"
+              f"{percentile(values, 0.95) * 1000:>10.2f}{percentile(values, 0.99) * 1000:>10.2f}")
+    if errors:
+        print(f"Ошибок: {len(errors)}, первая: {errors[0]!r}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
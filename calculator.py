@@ -0,0 +1,136 @@
+import ast
+import sys
+import math
+import time
+import operator
+from functools import lru_cache
+
+MAX_LENGTH = 10000
+MAX_NODES = 500
+MAX_EXPONENT = 10000
+MAX_BITS = 4096
+TIME_LIMIT = 0.5
+CACHE_SIZE = 4096
+
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+UNARY = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def check_result(value):
+    if isinstance(value, int):
+        if value.bit_length() > MAX_BITS:
+            raise ValueError("слишком большой результат")
+    elif not math.isfinite(value):
+        raise ValueError("слишком большой результат")
+    return value
+
+
+def checked_pow(base, exponent):
+    # размер результата оценивается до вычисления: 9**9**9 отвергается
+    # сразу, а не после долгого построения огромного числа
+    if abs(exponent) > MAX_EXPONENT:
+        raise ValueError("слишком большой показатель степени")
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+        if (abs(base).bit_length() - 1) * exponent > MAX_BITS:
+            raise ValueError("слишком большой результат")
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ValueError("результат не является действительным числом")
+    return result
+
+
+def build(node, counter):
+    # Превращает узел AST в замыкание f(deadline) -> число
+    counter[0] += 1
+    if counter[0] > MAX_NODES:
+        raise ValueError("слишком длинное выражение")
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = check_result(node.value)
+        return lambda deadline: value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+        op = UNARY[type(node.op)]
+        operand = build(node.operand, counter)
+        return lambda deadline: op(operand(deadline))
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+        op = checked_pow if isinstance(node.op, ast.Pow) else BINARY[type(node.op)]
+        left = build(node.left, counter)
+        right = build(node.right, counter)
+
+        def binary(deadline):
+            if time.monotonic() > deadline:
+                raise ValueError("превышено время вычисления")
+            return check_result(op(left(deadline), right(deadline)))
+        return binary
+    raise ValueError("недопустимая конструкция в выражении")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(text):
+    # Разбор и проверка выполняются один раз на каждый текст выражения;
+    # повторные вычисления берут готовое замыкание из кэша
+    if len(text) > MAX_LENGTH:
+        raise ValueError("слишком длинное выражение")
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError("синтаксическая ошибка") from None
+    except (RecursionError, MemoryError):
+        raise ValueError("слишком глубокая вложенность") from None
+    return build(tree.body, [0])
+
+
+def evaluate(text, time_limit=TIME_LIMIT):
+    evaluator = compile_expression(text)
+    try:
+        return evaluator(time.monotonic() + time_limit)
+    except OverflowError:
+        raise ValueError("слишком большой результат") from None
+
+
+def evaluate_lines(lines):
+    # Пакетный режим: по строке на выражение, пустые строки пропускаются.
+    # Ошибка в одном выражении не останавливает остальные.
+    for line in lines:
+        text = line.strip()
+        if not text:
+            continue
+        try:
+            yield text, evaluate(text), None
+        except ZeroDivisionError:
+            yield text, None, "деление на ноль"
+        except ValueError as e:
+            yield text, None, str(e)
+
+
+def run_batch(source, out):
+    # вывод копится и пишется пачками, а не print на каждую строку
+    buffer = []
+    for text, result, error in evaluate_lines(source):
+        buffer.append(f"{result}\n" if error is None else f"ошибка: {error}\n")
+        if len(buffer) >= 1000:
+            out.write(''.join(buffer))
+            buffer.clear()
+    out.write(''.join(buffer))
+
+
+def main():
+    # python calculator.py [файл] — вычисляет выражения из файла или stdin
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as source:
+            run_batch(source, sys.stdout)
+    else:
+        run_batch(sys.stdin, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Проверка выгрузки изменений во всех режимах хранения: одна и та же
+# история (добавления, удаления, выгрузки, компакции) выполняется в
+# каждом режиме в отдельном каталоге, и файлы выгрузок должны совпасть.
+# Удаления должны попадать в выгрузку, пока контрольная точка их не
+# прошла, как бы режим ни чистил журнал удалений.
+#
+#   python check_export_changes.py --storage json,journal,sqlite
+
+CHECKPOINT = 'tasks_export.checkpoint'
+
+
+def compact(repo):
+    # снимок переписывается целиком, как при компакции журнала
+    with repo.store.lock():
+        repo.store.save(repo.load())
+
+
+def scenario():
+    import personal_assistant as pa
+    from csv_export import export_changes
+    repo = pa.tasks_repo
+    fields = [column for column, _ in pa.TASK_CSV]
+    exports = []
+
+    def add(count):
+        for _ in range(count):
+            repo.put(pa.Tasks(repo.next_id(), 'задача', '', False, 'Средний', '01-01-2025'))
+
+    def export():
+        name = f'delta{len(exports)}.csv'
+        export_changes(name, repo, fields, CHECKPOINT)
+        with open(name, encoding='utf-8') as f:
+            exports.append(f.read())
+
+    add(6)
+    repo.delete(1)
+    compact(repo)
+    # контрольной точки ещё нет: удаление 1 должно попасть в первую выгрузку
+    export()
+    repo.delete(2, 3)
+    add(1)
+    compact(repo)
+    repo.delete(4)
+    export()
+    compact(repo)
+    repo.delete(5)
+    compact(repo)
+    export()
+    export()
+    return exports
+
+
+def run(storage):
+    workdir = tempfile.mkdtemp(prefix='assistant-export-')
+    env = dict(os.environ, ASSISTANT_STORAGE=storage,
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario'],
+                                cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Одинаковая выгрузка изменений во всех режимах хранения")
+    parser.add_argument('--storage', default='json,journal,sqlite', help="режимы хранения через запятую")
+    parser.add_argument('--scenario', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scenario:
+        json.dump(scenario(), sys.stdout)
+        return 0
+    results = {storage: run(storage) for storage in args.storage.split(',')}
+    expected_deleted = [1, 3, 1, 0]
+    failed = False
+    for storage, exports in results.items():
+        deleted = [text.count(',delete') for text in exports]
+        print(f"{storage}: удалений в выгрузках {deleted}")
+        if deleted != expected_deleted:
+            print(f"  ОШИБКА: ожидалось {expected_deleted}")
+            failed = True
+    reference = next(iter(results.values()))
+    for storage, exports in results.items():
+        if exports != reference:
+            print(f"  ОШИБКА: выгрузки в режиме {storage} отличаются от {next(iter(results))}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
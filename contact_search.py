@@ -0,0 +1,142 @@
+import re
+from array import array
+
+GRAM = 3
+# у цифр всего 10 символов, поэтому триграммы телефонов встречаются слишком
+# часто; для запросов от PHONE_GRAM цифр есть отдельный индекс по 6-граммам
+PHONE_GRAM = 6
+# индекс -> (позиция нормализованной строки в записи, длина n-граммы)
+GRAM_INDEXES = {'name': (0, GRAM), 'phone': (1, GRAM), 'phone_long': (1, PHONE_GRAM), 'email': (2, GRAM)}
+PHONE_QUERY_RE = re.compile(r'[\d\s()+\-.]+')
+NON_DIGIT_RE = re.compile(r'\D')
+
+
+def normalize_text(text):
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+def phone_digits(phone):
+    # +7 (900) 123-45-67 и 8 900 1234567 приводятся к 9001234567
+    digits = NON_DIGIT_RE.sub('', phone)
+    if len(digits) == 11 and digits[0] in '78':
+        return digits[1:]
+    return digits
+
+
+def phone_query_variants(query):
+    digits = NON_DIGIT_RE.sub('', query)
+    if not digits:
+        return []
+    variants = [digits]
+    # неполный номер с кодом страны: ищем и без первой цифры
+    if len(digits) > 1 and (query.lstrip().startswith('+7') or digits[0] == '8'):
+        variants.append(digits[1:])
+    return variants
+
+
+class ContactIndex:
+    # Триграммный индекс по нормализованному имени, email и цифрам телефона.
+    # Для подстроки длиной от GRAM символов кандидаты берутся из самого
+    # короткого списка среди её триграмм и проверяются по сохранённым
+    # нормализованным строкам; короткие запросы проверяют строки подряд.
+    # Списки только дополняются, устаревшие позиции отсеиваются проверкой,
+    # а когда их становится больше половины, индекс перестраивается.
+    def __init__(self, repo):
+        self.repo = repo
+        self.entries = None
+        self.grams = None
+        self.size = 0
+        self.stale = 0
+        repo.subscribe(self)
+
+    def ensure(self):
+        # refresh сбросит индекс, если файл контактов изменился на диске
+        self.repo.refresh()
+        if self.entries is None:
+            self.rebuild()
+
+    def rebuild(self):
+        self.entries = {}
+        self.grams = {name: {} for name in GRAM_INDEXES}
+        self.size = 0
+        self.stale = 0
+        for contact in self.repo.iter():
+            self._add(contact)
+
+    def _add(self, contact):
+        keys = (normalize_text(contact.name), phone_digits(contact.phone), normalize_text(contact.email))
+        self.entries[contact.id] = keys
+        for name, (position, size) in GRAM_INDEXES.items():
+            key = keys[position]
+            grams = self.grams[name]
+            for gram in {key[i:i + size] for i in range(len(key) - size + 1)}:
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array('q')
+                postings.append(contact.id)
+                self.size += 1
+
+    def _remove(self, contact_id):
+        keys = self.entries.pop(contact_id, None)
+        if keys is not None:
+            self.stale += sum(max(len(keys[position]) - size + 1, 0)
+                              for position, size in GRAM_INDEXES.values())
+
+    def _compact(self):
+        if self.stale > self.size // 2:
+            self.rebuild()
+
+    def records_put(self, contacts):
+        if self.entries is None:
+            return
+        for contact in contacts:
+            self._remove(contact.id)
+            self._add(contact)
+        self._compact()
+
+    def records_deleted(self, contact_ids):
+        if self.entries is None:
+            return
+        for contact_id in contact_ids:
+            self._remove(contact_id)
+        self._compact()
+
+    def records_reset(self):
+        self.entries = None
+        self.grams = None
+
+    def _match(self, field, needle, found, limit):
+        if field == 'phone' and len(needle) >= PHONE_GRAM:
+            field = 'phone_long'
+        position, size = GRAM_INDEXES[field]
+        if len(needle) < size:
+            candidates = self.entries
+        else:
+            grams = self.grams[field]
+            lists = []
+            for i in range(len(needle) - size + 1):
+                postings = grams.get(needle[i:i + size])
+                if postings is None:
+                    return
+                lists.append(postings)
+            candidates = min(lists, key=len)
+        entries = self.entries
+        for contact_id in candidates:
+            if limit is not None and len(found) >= limit:
+                return
+            keys = entries.get(contact_id)
+            if keys is not None and needle in keys[position]:
+                found[contact_id] = None
+
+    def search(self, query, limit=None):
+        self.ensure()
+        if not query.strip():
+            return list(self.entries)[:limit]
+        found = {}
+        text = normalize_text(query)
+        self._match('name', text, found, limit)
+        self._match('email', text, found, limit)
+        if PHONE_QUERY_RE.fullmatch(query):
+            for digits in phone_query_variants(query):
+                self._match('phone', digits, found, limit)
+        return sorted(found)
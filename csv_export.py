@@ -0,0 +1,71 @@
+import os
+import csv
+import json
+
+from storage import temp_path
+
+# Выгрузка изменений: в CSV попадают только записи, созданные или
+# изменённые после контрольной точки (версия _v новее сохранённого seq), и
+# удалённые после неё. Колонка change — 'upsert' (строка целиком) или
+# 'delete' (заполнен только id); строки идут в порядке изменений. Файл
+# пишется целиком во временный и подменяется, и только потом сохраняется
+# новая контрольная точка, так что после сбоя следующая выгрузка повторит
+# те же изменения, а не пропустит их.
+
+CHANGE_COLUMN = 'change'
+
+
+def read_checkpoint(path):
+    # None — выгрузок изменений ещё не было
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['seq']
+
+
+def write_checkpoint(path, seq):
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'seq': seq}, f)
+    os.replace(tmp_path, path)
+
+
+def write_csv(file_name, records, fields):
+    # полная выгрузка; возвращает число строк
+    count = 0
+    with open(file_name, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record.to_dict())
+            count += 1
+    return count
+
+
+def export_changes(file_name, repo, fields, checkpoint_path):
+    # Возвращает (выгружено изменённых, выгружено удалённых).
+    # Первая выгрузка — вся коллекция (since = -1): у записей из файлов,
+    # записанных до появления версий, и перенесённых в SQLite версия 0.
+    since = read_checkpoint(checkpoint_path)
+    if since is None:
+        since = -1
+    changed, deleted, seq = repo.changes_since(since)
+    if since > seq:
+        # данные пересозданы с нуля: контрольная точка от прежних
+        changed, deleted, seq = repo.changes_since(-1)
+    versions = repo.store.versions
+    rows = [(versions.get(record.id, 0), record) for record in changed]
+    rows += [(version, record_id) for record_id, version in deleted.items()]
+    rows.sort(key=lambda row: row[0])
+    tmp_path = temp_path(file_name)
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fields + [CHANGE_COLUMN])
+        writer.writeheader()
+        for _, row in rows:
+            if isinstance(row, int):
+                writer.writerow({'id': row, CHANGE_COLUMN: 'delete'})
+            else:
+                writer.writerow({**row.to_dict(), CHANGE_COLUMN: 'upsert'})
+    os.replace(tmp_path, file_name)
+    write_checkpoint(checkpoint_path, seq)
+    return len(changed), len(deleted)
@@ -0,0 +1,281 @@
+import io
+import os
+import csv
+import json
+import math
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from record_fields import encode_date_text, encode_timestamp
+
+# Файл режется на куски по CHUNK_SIZE байт по границам строк; куски
+# разбираются и проверяются в пуле из IMPORT_WORKERS процессов (файлы меньше
+# одного куска — в текущем процессе), а проверенные строки сохраняются
+# в порядке файла, по куску за раз.
+CHUNK_SIZE = 4 << 20
+IMPORT_WORKERS = int(os.environ.get('ASSISTANT_IMPORT_WORKERS', '0')) or os.cpu_count() or 1
+SCAN_BLOCK = 1 << 20
+TRUE_VALUES = {'True', 'true', '1'}
+FALSE_VALUES = {'False', 'false', '0', ''}
+
+
+# Проверки полей: значение из CSV -> значение для конструктора записи или
+# ValueError с описанием. Функции и Choice передаются в процессы пула.
+
+def text(value):
+    return value
+
+
+def required(value):
+    if not value.strip():
+        raise ValueError("пустое значение")
+    return value
+
+
+def integer(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"ожидалось целое число: {value!r}") from None
+
+
+def number(value):
+    try:
+        result = float(value)
+    except ValueError:
+        raise ValueError(f"ожидалось число: {value!r}") from None
+    if not math.isfinite(result):
+        raise ValueError(f"ожидалось конечное число: {value!r}")
+    return result
+
+
+def flag(value):
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"ожидалось True или False: {value!r}")
+
+
+def date(value):
+    # тот же формат, что при вводе вручную; канонические даты проверяются
+    # через кэш без strptime
+    if not isinstance(encode_date_text(value), int):
+        try:
+            datetime.strptime(value, '%d-%m-%Y')
+        except ValueError:
+            raise ValueError(f"неверная дата (ДД-ММ-ГГГГ): {value!r}") from None
+    return value
+
+
+def timestamp(value):
+    if not isinstance(encode_timestamp(value), int):
+        try:
+            datetime.strptime(value, '%d-%m-%Y %H:%M:%S')
+        except ValueError:
+            raise ValueError(f"неверное время (ДД-ММ-ГГГГ ЧЧ:ММ:СС): {value!r}") from None
+    return value
+
+
+class Choice:
+    def __init__(self, values):
+        self.values = tuple(values)
+
+    def __call__(self, value):
+        if value not in self.values:
+            raise ValueError(f"допустимо {'/'.join(self.values)}: {value!r}")
+        return value
+
+
+def read_progress(progress_path, signature):
+    # (сохранено строк, смещение первого несохранённого куска)
+    if not os.path.exists(progress_path):
+        return 0, 0
+    with open(progress_path, 'r', encoding='utf-8') as f:
+        progress = json.load(f)
+    if progress.get('signature') != signature or 'offset' not in progress:
+        return 0, 0
+    return progress['rows'], progress['offset']
+
+
+def write_progress(progress_path, signature, rows, offset):
+    tmp_path = progress_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'rows': rows, 'offset': offset}, f)
+    os.replace(tmp_path, progress_path)
+
+
+def csv_signature(file_name):
+    st = os.stat(file_name)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_header(file_name):
+    # (колонки, смещение первой строки данных)
+    with open(file_name, 'rb') as f:
+        line = f.readline()
+    header = next(csv.reader([line.decode('utf-8')]), [])
+    return header, len(line)
+
+
+def chunk_ranges(file_name, start, chunk_size):
+    # Границы кусков (начало, конец) — переводы строк не ближе chunk_size
+    # от начала куска. Перевод строки внутри поля в кавычках границей не
+    # считается: до настоящей границы от начала куска чётное число кавычек
+    # (удвоенные кавычки внутри поля тоже дают пару).
+    chunk_start = position = start
+    target = start + chunk_size
+    quotes = 0
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        while True:
+            block = f.read(SCAN_BLOCK)
+            if not block:
+                break
+            index = 0
+            while True:
+                if position + index < target:
+                    stop = min(target - position, len(block))
+                    quotes += block.count(b'"', index, stop)
+                    index = stop
+                    if index == len(block):
+                        break
+                newline = block.find(b'\n', index)
+                if newline < 0:
+                    quotes += block.count(b'"', index)
+                    break
+                quotes += block.count(b'"', index, newline)
+                index = newline + 1
+                if quotes % 2 == 0:
+                    yield chunk_start, position + index
+                    chunk_start = position + index
+                    target = chunk_start + chunk_size
+                    quotes = 0
+            position += len(block)
+    if chunk_start < position:
+        yield chunk_start, position
+
+
+def parse_chunk(file_name, start, end, fields):
+    # Разбор и проверка одного куска. fields: [(колонка, позиция, проверка)].
+    # Возвращает (строк, [кортежи значений], [(номер строки в куске, ошибка,
+    # исходные поля)]).
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    rows, rejects = [], []
+    count = 0
+    for row in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+        if not row:
+            continue
+        count += 1
+        try:
+            rows.append(tuple([convert(row[position]) for _, position, convert in fields]))
+        except (ValueError, IndexError):
+            rejects.append((count, row_error(row, fields), row))
+    return count, rows, rejects
+
+
+def row_error(row, fields):
+    for column, position, convert in fields:
+        if position >= len(row):
+            return f"нет значения {column}"
+        try:
+            convert(row[position])
+        except ValueError as e:
+            return f"{column}: {e}"
+    return "неверная строка"
+
+
+def parsed_chunks(file_name, ranges, fields, workers):
+    # результаты кусков в порядке файла: (конец куска, результат разбора);
+    # в пуле в работе не больше 2 * workers кусков, чтобы не копить память
+    if workers <= 1:
+        for start, end in ranges:
+            yield end, parse_chunk(file_name, start, end, fields)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append((end, pool.submit(parse_chunk, file_name, start, end, fields)))
+            if len(pending) >= workers * 2:
+                end, future = pending.popleft()
+                yield end, future.result()
+        while pending:
+            end, future = pending.popleft()
+            yield end, future.result()
+
+
+def import_csv(file_name, repo, columns, record_type, workers=None, chunk_size=CHUNK_SIZE):
+    # columns: [(колонка CSV, проверка)] в порядке аргументов record_type.
+    # Проверенные куски сохраняются в порядке файла, каждый отдельной
+    # пачкой (Repository.put_new): коллекция в память не загружается, а
+    # дубли проверяются по id хранилища, так что память не зависит ни от
+    # размера файла, ни от размера коллекции (кроме множества id). После
+    # каждого куска в <файл>.progress записываются число строк и смещение,
+    # так что после сбоя повторный импорт того же файла продолжится с
+    # первого несохранённого куска. Строки, не прошедшие проверку, пишутся
+    # в <файл>.rejects.csv с номером строки и причиной.
+    # Возвращает (добавлено, пропущено дублей, отклонено).
+    progress_path = file_name + '.progress'
+    rejects_path = file_name + '.rejects.csv'
+    signature = csv_signature(file_name)
+    header, data_start = read_header(file_name)
+    missing = [column for column, _ in columns if column not in header]
+    if missing:
+        raise ValueError(f"в файле нет колонок: {', '.join(missing)}")
+    fields = [(column, header.index(column), convert) for column, convert in columns]
+    committed, offset = read_progress(progress_path, signature)
+    if committed:
+        print(f"Продолжение импорта со строки {committed + 1}.")
+    else:
+        offset = data_start
+        if os.path.exists(rejects_path):
+            os.remove(rejects_path)
+    if workers is None:
+        workers = IMPORT_WORKERS
+    if signature[0] - offset <= chunk_size:
+        workers = 1
+    imported = duplicates = rejected = 0
+    rows_done = committed
+    started = time.perf_counter()
+    rejects_file = writer = None
+    try:
+        with repo.bulk():
+            for end, (count, rows, rejects) in parsed_chunks(
+                    file_name, chunk_ranges(file_name, offset, chunk_size), fields, workers):
+                batch = {}
+                for values in rows:
+                    record = record_type(*values)
+                    batch.setdefault(record.id, record)
+                written = repo.put_new(batch.values())
+                imported += written
+                duplicates += len(rows) - written
+                if rejects:
+                    if writer is None:
+                        rejects_file = open(rejects_path, 'a', encoding='utf-8', newline='')
+                        writer = csv.writer(rejects_file)
+                        if rejects_file.tell() == 0:
+                            writer.writerow(['row', 'error'] + header)
+                    writer.writerows([rows_done + number, error] + row for number, error, row in rejects)
+                    rejects_file.flush()
+                    rejected += len(rejects)
+                rows_done += count
+                write_progress(progress_path, signature, rows_done, end)
+                report_progress(rows_done - committed, started)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    if rejected:
+        print(f"Отклонено строк: {rejected}, подробности в {rejects_path}")
+    return imported, duplicates, rejected
+
+
+def report_progress(rows, started):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"Обработано строк: {rows} ({rate:.0f} строк/с)")
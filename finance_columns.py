@@ -0,0 +1,135 @@
+from array import array
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from finance_index import date_ordinal, to_minor
+
+HAS_NUMPY = np is not None
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+NO_DATE = -1
+
+
+class LedgerColumns:
+    # Колоночное представление журнала: id, сумма в копейках (int64),
+    # ordinal даты (int32, NO_DATE для неразборчивых дат) и код категории
+    # (int32) со словарём categories. Все выборки и группировки выполняются
+    # векторно средствами numpy.
+    def __init__(self, ids, amounts, ordinals, codes, categories):
+        self.ids = ids
+        self.amounts = amounts
+        self.ordinals = ordinals
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows: (id, amount, category, date) в любом количестве, по одной
+        ids, amounts, ordinals, codes = array('q'), array('q'), array('i'), array('i')
+        lookup = {}
+        categories = []
+        for record_id, amount, category, day in rows:
+            code = lookup.get(category)
+            if code is None:
+                code = lookup[category] = len(categories)
+                categories.append(category)
+            ordinal = date_ordinal(day)
+            ids.append(record_id)
+            amounts.append(to_minor(amount))
+            ordinals.append(NO_DATE if ordinal is None else ordinal)
+            codes.append(code)
+        return cls(np.frombuffer(ids, dtype=np.int64), np.frombuffer(amounts, dtype=np.int64),
+                   np.frombuffer(ordinals, dtype=np.int32), np.frombuffer(codes, dtype=np.int32),
+                   categories)
+
+    @classmethod
+    def from_records(cls, records):
+        return cls.from_rows((r.id, r.amount, r.category, r.date) for r in records)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, mask):
+        return LedgerColumns(self.ids[mask], self.amounts[mask], self.ordinals[mask],
+                             self.codes[mask], self.categories)
+
+    def filter(self, start=None, end=None, category=None):
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.ordinals >= start
+        if end is not None:
+            mask &= (self.ordinals <= end) & (self.ordinals != NO_DATE)
+        if category is not None:
+            if category not in self.categories:
+                mask[:] = False
+            else:
+                mask &= self.codes == self.categories.index(category)
+        return self.take(mask)
+
+    def _sums(self, keys, size):
+        income = np.bincount(keys, weights=np.where(self.amounts > 0, self.amounts, 0), minlength=size)
+        expense = np.bincount(keys, weights=np.where(self.amounts < 0, self.amounts, 0), minlength=size)
+        count = np.bincount(keys, minlength=size)
+        return income.astype(np.int64), expense.astype(np.int64), count
+
+    def by_category(self):
+        # [(категория, доход, расход, число операций)]
+        income, expense, count = self._sums(self.codes, len(self.categories))
+        return [(self.categories[code], int(income[code]), int(expense[code]), int(count[code]))
+                for code in np.flatnonzero(count)]
+
+    def _by_period(self, unit):
+        dated = self.take(self.ordinals != NO_DATE)
+        if not len(dated):
+            return []
+        days = (dated.ordinals.astype(np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+        periods = days.astype(f'datetime64[{unit}]').astype(np.int64)
+        first = periods.min()
+        income, expense, count = dated._sums(periods - first, int(periods.max() - first) + 1)
+        return [(np.datetime64(int(first + offset), unit).item(), int(income[offset]),
+                 int(expense[offset]), int(count[offset]))
+                for offset in np.flatnonzero(count)]
+
+    def by_month(self):
+        # [(date первого дня месяца, доход, расход, число операций)]
+        return self._by_period('M')
+
+    def by_year(self):
+        return self._by_period('Y')
+
+    def top_expenses(self, n=5):
+        # [(категория, расход)] по убыванию модуля расхода
+        expense = np.bincount(self.codes, weights=np.where(self.amounts < 0, -self.amounts, 0),
+                              minlength=len(self.categories)).astype(np.int64)
+        order = np.argsort(-expense, kind='stable')[:n]
+        return [(self.categories[code], -int(expense[code])) for code in order if expense[code] > 0]
+
+
+class LedgerColumnsCache:
+    # Колонки строятся по запросу из финансового репозитория и сбрасываются
+    # при любом его изменении, а также когда подпись хранилища отличается
+    # от той, по которой они построены (файл изменил другой сеанс).
+    def __init__(self, repo):
+        self.repo = repo
+        self.columns = None
+        self.signature = None
+        repo.subscribe(self)
+
+    def get(self):
+        signature = self.repo.current_signature()
+        if self.columns is None or self.signature != signature:
+            self.columns = LedgerColumns.from_records(self.repo.iter())
+            self.signature = signature
+        return self.columns
+
+    def records_put(self, records):
+        self.columns = None
+
+    def records_deleted(self, record_ids):
+        self.columns = None
+
+    def records_reset(self):
+        self.columns = None
@@ -0,0 +1,233 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+
+DAY_MARGIN = 366
+
+
+# различных дат в журнале немного, поэтому разбор кэшируется
+@lru_cache(maxsize=65536)
+def date_ordinal(text):
+    try:
+        return datetime.strptime(text, '%d-%m-%Y').toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def to_minor(amount):
+    # суммы хранятся в записях как float; агрегаты ведутся в копейках,
+    # чтобы накопленные итоги не расходились из-за ошибок округления
+    return round(amount * 100)
+
+
+def format_money(minor):
+    sign = '-' if minor < 0 else ''
+    return f"{sign}{abs(minor) // 100}.{abs(minor) % 100:02d}"
+
+
+class Fenwick:
+    def __init__(self, values):
+        tree = array('q', [0]) + array('q', values)
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, index, delta):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        # сумма элементов [0, index]
+        index = min(index + 1, len(self.tree) - 1)
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def range(self, lo, hi):
+        if hi < lo:
+            return 0
+        return self.prefix(hi) - (self.prefix(lo - 1) if lo > 0 else 0)
+
+
+class LedgerIndex:
+    # Финансовые записи, упорядоченные по дате: три параллельных массива
+    # (ordinal даты, id, сумма в копейках). Дата разбирается один раз при
+    # добавлении записи. Поверх массивов поддерживаются итоги по всему
+    # журналу и деревья Фенвика по дням (доход, расход, число операций),
+    # так что баланс отвечается за O(1), а итоги периода — за O(log n).
+    # Записи с неразборчивой датой учитываются только в общем балансе.
+    def __init__(self, repo):
+        self.repo = repo
+        self.ordinals = None
+        self.ids = None
+        self.amounts = None
+        self.dates = None
+        self.undated = None
+        self.income = self.expense = 0
+        self.base = 0
+        self.days = 0
+        self.day_income = self.day_expense = self.day_count = None
+        repo.subscribe(self)
+
+    def ensure(self):
+        # refresh сбросит индекс, если файл финансов изменился на диске
+        self.repo.refresh()
+        if self.ordinals is None:
+            self.rebuild()
+
+    def rebuild(self):
+        rows = []
+        self.undated = {}
+        for record in self.repo.iter():
+            ordinal = date_ordinal(record.date)
+            if ordinal is None:
+                self.undated[record.id] = to_minor(record.amount)
+            else:
+                rows.append((ordinal, record.id, to_minor(record.amount)))
+        rows.sort()
+        self.ordinals = array('i', (row[0] for row in rows))
+        self.ids = array('q', (row[1] for row in rows))
+        self.amounts = array('q', (row[2] for row in rows))
+        self.dates = {row[1]: row[0] for row in rows}
+        self.income = self.expense = 0
+        for amount in self.amounts:
+            self._count_total(amount, 1)
+        for amount in self.undated.values():
+            self._count_total(amount, 1)
+        self._build_days()
+
+    def _build_days(self):
+        if self.ordinals:
+            first, last = self.ordinals[0], self.ordinals[-1]
+        else:
+            first = last = datetime.now().toordinal()
+        self.base = first - DAY_MARGIN
+        self.days = last + DAY_MARGIN - self.base + 1
+        income = [0] * self.days
+        expense = [0] * self.days
+        count = [0] * self.days
+        for ordinal, amount in zip(self.ordinals, self.amounts):
+            day = ordinal - self.base
+            if amount > 0:
+                income[day] += amount
+            else:
+                expense[day] += amount
+            count[day] += 1
+        self.day_income = Fenwick(income)
+        self.day_expense = Fenwick(expense)
+        self.day_count = Fenwick(count)
+
+    def _count_total(self, amount, sign):
+        if amount > 0:
+            self.income += sign * amount
+        else:
+            self.expense += sign * amount
+
+    def _count_day(self, ordinal, amount, sign):
+        day = ordinal - self.base
+        if amount > 0:
+            self.day_income.add(day, sign * amount)
+        else:
+            self.day_expense.add(day, sign * amount)
+        self.day_count.add(day, sign)
+
+    def _position(self, record_id, ordinal):
+        lo = bisect_left(self.ordinals, ordinal)
+        hi = bisect_right(self.ordinals, ordinal)
+        for position in range(lo, hi):
+            if self.ids[position] == record_id:
+                return position
+        return None
+
+    def _remove(self, record_id):
+        if record_id in self.undated:
+            self._count_total(self.undated.pop(record_id), -1)
+            return
+        ordinal = self.dates.pop(record_id, None)
+        if ordinal is None:
+            return
+        position = self._position(record_id, ordinal)
+        amount = self.amounts[position]
+        del self.ordinals[position]
+        del self.ids[position]
+        del self.amounts[position]
+        self._count_total(amount, -1)
+        self._count_day(ordinal, amount, -1)
+
+    def _insert(self, record):
+        amount = to_minor(record.amount)
+        self._count_total(amount, 1)
+        ordinal = date_ordinal(record.date)
+        if ordinal is None:
+            self.undated[record.id] = amount
+            return
+        position = bisect_right(self.ordinals, ordinal)
+        self.ordinals.insert(position, ordinal)
+        self.ids.insert(position, record.id)
+        self.amounts.insert(position, amount)
+        self.dates[record.id] = ordinal
+        if 0 <= ordinal - self.base < self.days:
+            self._count_day(ordinal, amount, 1)
+        else:
+            # дата вне покрытого диапазона дней: деревья строятся заново
+            self._build_days()
+
+    def records_put(self, records):
+        if self.ordinals is None:
+            return
+        if len(records) > len(self.ordinals) // 8 + 64:
+            # крупная пачка (импорт): пересортировать всё дешевле, чем
+            # вставлять по одной со сдвигом массивов
+            self.rebuild()
+            return
+        for record in records:
+            self._remove(record.id)
+            self._insert(record)
+
+    def records_deleted(self, record_ids):
+        if self.ordinals is None:
+            return
+        for record_id in record_ids:
+            self._remove(record_id)
+
+    def records_reset(self):
+        self.ordinals = None
+
+    def balance(self):
+        self.ensure()
+        return self.income + self.expense
+
+    def period_totals(self, start_ordinal, end_ordinal):
+        # (число операций, доход, расход), суммы в копейках
+        self.ensure()
+        lo = max(start_ordinal - self.base, 0)
+        hi = min(end_ordinal - self.base, self.days - 1)
+        return (self.day_count.range(lo, hi),
+                self.day_income.range(lo, hi),
+                self.day_expense.range(lo, hi))
+
+
+class LedgerQuery:
+    # Итоги запросами к хранилищу, без загрузки журнала в память: в SQLite
+    # записи периода отбираются по индексу date_ord.
+    def __init__(self, repo):
+        self.repo = repo
+
+    def balance(self):
+        return sum(to_minor(record.amount) for record in self.repo.iter())
+
+    def period_totals(self, start_ordinal, end_ordinal):
+        def in_period(record):
+            ordinal = date_ordinal(record.date)
+            return ordinal is not None and start_ordinal <= ordinal <= end_ordinal
+        records = self.repo.query(in_period, 'date_ord BETWEEN ? AND ?', (start_ordinal, end_ordinal))
+        amounts = [to_minor(record.amount) for record in records]
+        return (len(amounts), sum(amount for amount in amounts if amount > 0),
+                sum(amount for amount in amounts if amount <= 0))
@@ -0,0 +1,229 @@
+import os
+import json
+import mmap
+import heapq
+import struct
+from operator import itemgetter
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from finance_index import date_ordinal, to_minor
+
+# Файл журнала финансов для аналитики без объектов записей. После заголовка
+# (MAGIC, версия, число строк, итоги дохода и расхода в копейках, JSON с
+# подписью исходных данных и словарём категорий) идут строки фиксированной
+# ширины, упорядоченные по (дата, id):
+#   id int64, сумма в копейках int64, ordinal даты int32 (NO_DATE — дата
+#   не разбирается), код категории int32, смещение и длина описания int64
+# Описания лежат подряд в UTF-8 в отдельном файле-куче (<имя>.heap).
+#
+# Файл отображается в память через mmap: баланс берётся из заголовка,
+# границы периода ищутся двоичным поиском по колонке дат, а суммы периода
+# считаются прямо по отображённым страницам (numpy.frombuffer или
+# struct.iter_unpack по memoryview), без разбора и без загрузки журнала.
+
+MAGIC = b'PAL\x00'
+VERSION = 1
+HEADER = struct.Struct('<4sHIqqq')
+ROW = struct.Struct('<qqiiqq')
+AMOUNT = struct.Struct('<8xq24x')
+ORDINAL = struct.Struct('<i')
+ORDINAL_OFFSET = 16
+NO_DATE = -1
+# порядок строк — (дата, id); строки журнала при записи — кортежи полей ROW
+ROW_KEY = itemgetter(2, 0)
+RUN_ROWS = 1 << 16
+RUN_READ_ROWS = 1024
+
+if np is not None:
+    ROW_DTYPE = np.dtype([('id', '<i8'), ('amount', '<i8'), ('ordinal', '<i4'), ('code', '<i4'),
+                          ('offset', '<i8'), ('length', '<i8')])
+
+
+def signature_key(signature):
+    # подпись хранилища в том виде, в каком она читается из JSON
+    return json.loads(json.dumps(signature))
+
+
+def write_ledger(path, heap_path, records, signature):
+    # Строки упорядочиваются внешней сортировкой: по мере обхода записей
+    # они копятся кусками по RUN_ROWS, каждый кусок сортируется и пишется во
+    # временный файл, а затем куски сливаются (heapq.merge), так что память
+    # не зависит от размера журнала.
+    lookup = {}
+    categories = []
+    income = expense = count = 0
+    heap_tmp = f'{heap_path}.{os.getpid()}.tmp'
+    runs = []
+    run = []
+    try:
+        with open(heap_tmp, 'wb') as heap:
+            offset = 0
+            for record in records:
+                code = lookup.get(record.category)
+                if code is None:
+                    code = lookup[record.category] = len(categories)
+                    categories.append(record.category)
+                amount = to_minor(record.amount)
+                if amount > 0:
+                    income += amount
+                else:
+                    expense += amount
+                ordinal = date_ordinal(record.date)
+                text = (record.description or '').encode('utf-8')
+                heap.write(text)
+                run.append((record.id, amount, NO_DATE if ordinal is None else ordinal, code, offset, len(text)))
+                offset += len(text)
+                count += 1
+                if len(run) >= RUN_ROWS:
+                    runs.append(write_run(f'{path}.{os.getpid()}.run{len(runs)}', run))
+                    run = []
+        run.sort(key=ROW_KEY)
+        rows = heapq.merge(*map(read_run, runs), run, key=ROW_KEY) if runs else run
+        meta = json.dumps({'signature': signature_key(signature), 'categories': categories,
+                           'heap_size': offset}, ensure_ascii=False).encode('utf-8')
+        meta += b' ' * (-(HEADER.size + len(meta)) % 8)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta), count, income, expense))
+            f.write(meta)
+            for row in rows:
+                f.write(ROW.pack(*row))
+    finally:
+        for run_path in runs:
+            os.remove(run_path)
+    # куча подменяется первой: строки, ссылающиеся на неё, появятся вместе
+    # с новым заголовком, а прежний файл не пройдёт проверку heap_size
+    os.replace(heap_tmp, heap_path)
+    os.replace(tmp_path, path)
+
+
+def write_run(path, rows):
+    rows.sort(key=ROW_KEY)
+    with open(path, 'wb') as f:
+        for row in rows:
+            f.write(ROW.pack(*row))
+    return path
+
+
+def read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(ROW.size * RUN_READ_ROWS)
+            if not block:
+                return
+            yield from ROW.iter_unpack(block)
+
+
+class OrdinalColumn:
+    # колонка дат поверх отображённого файла для bisect без numpy
+    def __init__(self, buffer, base, rows):
+        self.buffer = buffer
+        self.base = base + ORDINAL_OFFSET
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        return ORDINAL.unpack_from(self.buffer, self.base + index * ROW.size)[0]
+
+
+class MappedLedger:
+    # Тот же интерфейс итогов, что у LedgerIndex: balance() и
+    # period_totals(start, end) -> (число операций, доход, расход).
+    def __init__(self, path, heap_path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_size, self.rows, self.income, self.expense = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path}: неподдерживаемый файл журнала')
+        meta = json.loads(self.map[HEADER.size:HEADER.size + meta_size])
+        self.signature = meta['signature']
+        self.categories = meta['categories']
+        self.base = HEADER.size + meta_size
+        if len(self.map) != self.base + self.rows * ROW.size:
+            raise ValueError(f'{path}: файл журнала обрезан')
+        self.heap = None
+        if meta['heap_size']:
+            with open(heap_path, 'rb') as f:
+                self.heap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self.heap) if self.heap is not None else 0) != meta['heap_size']:
+            raise ValueError(f'{heap_path}: куча описаний не соответствует журналу')
+        if np is not None:
+            self.table = np.frombuffer(self.map, dtype=ROW_DTYPE, count=self.rows, offset=self.base)
+            self.ordinals = self.table['ordinal']
+        else:
+            self.table = None
+            self.ordinals = OrdinalColumn(self.map, self.base, self.rows)
+
+    def __len__(self):
+        return self.rows
+
+    def balance(self):
+        return self.income + self.expense
+
+    def period(self, start_ordinal, end_ordinal):
+        if self.table is not None:
+            return (int(np.searchsorted(self.ordinals, start_ordinal, 'left')),
+                    int(np.searchsorted(self.ordinals, end_ordinal, 'right')))
+        return bisect_left(self.ordinals, start_ordinal), bisect_right(self.ordinals, end_ordinal)
+
+    def period_totals(self, start_ordinal, end_ordinal):
+        lo, hi = self.period(max(start_ordinal, 0), end_ordinal)
+        if hi <= lo:
+            return 0, 0, 0
+        if self.table is not None:
+            amounts = self.table['amount'][lo:hi]
+            return (hi - lo, int(amounts[amounts > 0].sum()), int(amounts[amounts < 0].sum()))
+        income = expense = 0
+        rows = memoryview(self.map)[self.base + lo * ROW.size:self.base + hi * ROW.size]
+        try:
+            for amount, in AMOUNT.iter_unpack(rows):
+                if amount > 0:
+                    income += amount
+                else:
+                    expense += amount
+        finally:
+            rows.release()
+        return hi - lo, income, expense
+
+    def row(self, position):
+        # (id, сумма в копейках, ordinal даты, категория, описание)
+        record_id, amount, ordinal, code, offset, length = ROW.unpack_from(
+            self.map, self.base + position * ROW.size)
+        description = self.heap[offset:offset + length].decode('utf-8') if length else ''
+        return record_id, amount, ordinal, self.categories[code], description
+
+
+class LedgerFile:
+    # Файл журнала рядом с данными финансов. Он действителен, пока подпись
+    # хранилища (inode, размер и mtime файлов данных) совпадает с записанной
+    # в заголовке; иначе пересобирается потоковым обходом репозитория.
+    def __init__(self, path, repo):
+        self.path = path
+        self.heap_path = os.path.splitext(path)[0] + '.heap'
+        self.repo = repo
+        self.mapped = None
+
+    def get(self):
+        current = signature_key(self.repo.store.disk_signature())
+        if self.mapped is not None and self.mapped.signature == current:
+            return self.mapped
+        self.mapped = None
+        mapped = self.open()
+        if mapped is None or mapped.signature != current:
+            write_ledger(self.path, self.heap_path, self.repo.iter(), current)
+            mapped = self.open()
+        self.mapped = mapped
+        return mapped
+
+    def open(self):
+        try:
+            return MappedLedger(self.path, self.heap_path)
+        except (OSError, ValueError, struct.error):
+            return None
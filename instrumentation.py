@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import pstats
+import builtins
+import cProfile
+import functools
+
+# Необязательная статистика сессии. Включается переменной окружения
+# ASSISTANT_STATS=1 или флагом --stats; пока она выключена, функции не
+# оборачиваются, а хранилище проверяет только флаг stats.enabled.
+#
+# ASSISTANT_STATS_FILE — куда записать JSON при выходе
+# ASSISTANT_PROFILE_OPS — операции через запятую, которые выполняются
+#   под cProfile (результат в <операция>.prof и топ функций на экран)
+# SIGUSR1 включает и выключает cProfile для всей сессии (assistant_<pid>.prof)
+
+STATS_FILE = os.environ.get('ASSISTANT_STATS_FILE', 'assistant_stats.json')
+BUCKETS = 32
+PROFILE_TOP = 15
+
+
+class Histogram:
+    # Латентность по корзинам степеней двойки в микросекундах:
+    # корзина i — от 2**(i-1) до 2**i мкс
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = int(seconds * 1e6)
+        self.counts[min(micros.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # верхняя граница корзины, в которую попадает квантиль, в секундах
+        target = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99),
+                'buckets_us': {str(1 << bucket): count for bucket, count in enumerate(self.counts) if count}}
+
+
+class Stats:
+    def __init__(self):
+        self.enabled = False
+        self.ops = {}
+        self.files = {}
+        self.waiting = 0.0
+        self.profile_ops = set()
+        self.session_profile = None
+
+    def record(self, name, seconds):
+        histogram = self.ops.get(name)
+        if histogram is None:
+            histogram = self.ops[name] = Histogram()
+        histogram.add(seconds)
+
+    def _file(self, path):
+        entry = self.files.get(path)
+        if entry is None:
+            entry = self.files[path] = {'bytes_read': 0, 'bytes_written': 0, 'records_read': 0,
+                                        'records_written': 0, 'reads': 0, 'writes': 0}
+        return entry
+
+    def file_read(self, path, size, records):
+        entry = self._file(path)
+        entry['bytes_read'] += size
+        entry['records_read'] += records
+        entry['reads'] += 1
+
+    def file_written(self, path, size, records):
+        entry = self._file(path)
+        entry['bytes_written'] += size
+        entry['records_written'] += records
+        entry['writes'] += 1
+
+    def to_dict(self):
+        return {'operations': {name: h.to_dict() for name, h in self.ops.items()}, 'files': self.files}
+
+    def dump(self, path=STATS_FILE):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        lines = ['', 'Статистика сессии',
+                 f"{'операция':<28}{'вызовов':>8}{'всего, мс':>12}{'p50, мс':>10}{'p95, мс':>10}{'макс, мс':>10}"]
+        for name, h in sorted(self.ops.items(), key=lambda item: -item[1].total):
+            lines.append(f"{name:<28}{h.count:>8}{h.total * 1000:>12.2f}{h.quantile(0.5) * 1000:>10.2f}"
+                         f"{h.quantile(0.95) * 1000:>10.2f}{h.max * 1000:>10.2f}")
+        if self.files:
+            lines.append('')
+            lines.append(f"{'файл':<28}{'прочитано':>12}{'записей':>10}{'записано':>12}{'записей':>10}")
+            for path, entry in sorted(self.files.items()):
+                lines.append(f"{path:<28}{entry['bytes_read']:>12}{entry['records_read']:>10}"
+                             f"{entry['bytes_written']:>12}{entry['records_written']:>10}")
+        return lines
+
+
+stats = Stats()
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def timed(name, func):
+    # Время операции без ожидания ввода пользователя: паузы в input()
+    # накапливаются в stats.waiting и вычитаются
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if name in stats.profile_ops:
+            return profiled(name, func, *args, **kwargs)
+        waiting = stats.waiting
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record(name, time.perf_counter() - started - (stats.waiting - waiting))
+    return wrapper
+
+
+def profiled(name, func, *args, **kwargs):
+    profile = cProfile.Profile()
+    waiting = stats.waiting
+    started = time.perf_counter()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        stats.record(name, time.perf_counter() - started - (stats.waiting - waiting))
+        profile.dump_stats(f'{name}.prof')
+        pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+
+def toggle_session_profile(signum=None, frame=None):
+    if stats.session_profile is None:
+        stats.session_profile = cProfile.Profile()
+        stats.session_profile.enable()
+        print(f"\n[cProfile включён, pid {os.getpid()}]", file=sys.stderr)
+    else:
+        stats.session_profile.disable()
+        path = f'assistant_{os.getpid()}.prof'
+        stats.session_profile.dump_stats(path)
+        stats.session_profile = None
+        print(f"\n[cProfile выключен, результат в {path}]", file=sys.stderr)
+
+
+def report():
+    if stats.session_profile is not None:
+        toggle_session_profile()
+    sys.stderr.write('\n'.join(stats.summary()) + '\n')
+    stats.dump()
+    sys.stderr.write(f"Статистика записана в {STATS_FILE}\n")
+
+
+def enable(namespace=None, names=()):
+    # Включает сбор статистики и оборачивает функции names в namespace
+    # (словарь глобальных имён модуля). Повторный вызов только добавляет
+    # обёртки.
+    if namespace is not None:
+        for name in names:
+            namespace[name] = timed(name, namespace[name])
+    if stats.enabled:
+        return
+    stats.enabled = True
+    stats.profile_ops = {op.strip() for op in os.environ.get('ASSISTANT_PROFILE_OPS', '').split(',')
+                         if op.strip()}
+    real_input = builtins.input
+
+    def waiting_input(prompt=''):
+        started = time.perf_counter()
+        try:
+            return real_input(prompt)
+        finally:
+            stats.waiting += time.perf_counter() - started
+    builtins.input = waiting_input
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, toggle_session_profile)
+    atexit.register(report)
+
+
+def requested(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return os.environ.get('ASSISTANT_STATS') == '1' or '--stats' in argv
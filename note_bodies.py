@@ -0,0 +1,208 @@
+import os
+import re
+import glob
+import threading
+
+from storage import FileStore, JOURNAL_MAX_BYTES, JOURNAL_RATIO
+from record_fields import SlotField
+
+# Тексты заметок хранятся отдельно от остальных полей: в файлах
+# <имя>.<поколение>.bodies подряд в UTF-8, а в снимке и журнале заметки
+# вместо текста лежит ссылка (поколение, смещение, длина в байтах). Список
+# заметок, поиск по заголовку и выбор по id разбирают только эти
+# метаданные; текст читается из файла при обращении к note.content.
+#
+# Новый или изменённый текст дописывается в конец файла текущего
+# поколения (под блокировкой хранилища, до записи ссылок на него), а
+# прежний остаётся мусором до компакции: compact() переписывает живые
+# тексты в файл следующего поколения и вместе с ним снимок. Компакция
+# запускается и сама при записи, когда файл текущего поколения вырос до
+# BODIES_MIN_BYTES, а живых текстов в нём меньше BODIES_RATIO, как у
+# журнала. Файлы позапрошлых поколений удаляются, прошлого — остаются до
+# следующей компакции, чтобы процессы, ещё не перечитавшие метаданные,
+# могли дочитать тексты.
+
+BODIES_RE = re.compile(r'\.(\d+)\.bodies$')
+BODIES_MIN_BYTES = JOURNAL_MAX_BYTES
+BODIES_RATIO = JOURNAL_RATIO
+
+
+class BodyRef:
+    __slots__ = ('bodies', 'generation', 'offset', 'length')
+
+    def __init__(self, bodies, generation, offset, length):
+        self.bodies = bodies
+        self.generation = generation
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        return self.bodies.read(self.generation, self.offset, self.length)
+
+
+class BodyField(SlotField):
+    # В слоте либо строка (текст ещё не записан в файл), либо BodyRef
+    def decode(self, value):
+        return value.read() if isinstance(value, BodyRef) else value
+
+    def ref(self, obj):
+        value = getattr(obj, self.slot)
+        return value if isinstance(value, BodyRef) else None
+
+    def set_ref(self, obj, ref):
+        setattr(obj, self.slot, ref)
+
+
+class NoteBodies:
+    def __init__(self, base):
+        self.base = base
+        # поколение -> открытый для чтения файл; seek и read одного файла
+        # из цикла событий и из потока записи сервера не должны чередоваться
+        self.files = {}
+        self.read_lock = threading.Lock()
+
+    def path(self, generation):
+        return f'{self.base}.{generation}.bodies'
+
+    def generations(self):
+        found = []
+        for path in glob.glob(glob.escape(self.base) + '.*.bodies'):
+            match = BODIES_RE.search(path)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def current(self):
+        return max(self.generations(), default=0)
+
+    def size(self):
+        return sum(os.path.getsize(self.path(generation)) for generation in self.generations())
+
+    def append(self, texts, generation=None):
+        # Дописывает тексты одним куском и возвращает ссылки на них;
+        # вызывается под эксклюзивной блокировкой хранилища
+        if generation is None:
+            generation = self.current()
+        chunks = [text.encode('utf-8') for text in texts]
+        with open(self.path(generation), 'ab') as f:
+            offset = f.tell()
+            f.write(b''.join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+        refs = []
+        for chunk in chunks:
+            refs.append(BodyRef(self, generation, offset, len(chunk)))
+            offset += len(chunk)
+        return refs
+
+    def read(self, generation, offset, length):
+        if not length:
+            return ''
+        with self.read_lock:
+            f = self.files.get(generation)
+            if f is None:
+                f = self.files[generation] = open(self.path(generation), 'rb')
+            f.seek(offset)
+            data = f.read(length)
+        if len(data) != length:
+            raise ValueError(f'{self.path(generation)}: текст заметки обрезан')
+        return data.decode('utf-8')
+
+    def live_bytes(self, records, field, generation):
+        refs = (field.ref(record) for record in records)
+        return sum(ref.length for ref in refs if ref is not None and ref.generation == generation)
+
+    def drop_before(self, generation):
+        # свои открытые файлы закрываются до удаления; в Windows файл, ещё
+        # открытый другим процессом, не удалить — он останется до следующей
+        # компакции
+        for old in self.generations():
+            if old < generation:
+                with self.read_lock:
+                    f = self.files.pop(old, None)
+                    if f is not None:
+                        f.close()
+                try:
+                    os.remove(self.path(old))
+                except PermissionError:
+                    pass
+
+
+class NoteStore(FileStore):
+    # FileStore заметок: в снимок и журнал пишутся ссылки на тексты
+    def __init__(self, path, record_type, **options):
+        super().__init__(path, record_type, **options)
+        self.bodies = NoteBodies(os.path.splitext(path)[0])
+        self.body_field = record_type.content
+
+    def _record(self, data):
+        if 'content' in data:
+            # файлы, записанные до выделения текстов: тексты переедут в
+            # файл текстов при следующей записи снимка
+            return self.record_type.from_dict(data)
+        return self.record_type(data['id'], data['title'],
+                                BodyRef(self.bodies, data['body_file'], data['body_offset'], data['body_length']),
+                                data['timestamp'])
+
+    def _dict(self, record):
+        ref = self.body_field.ref(record)
+        return {'id': record.id, 'title': record.title, 'timestamp': record.timestamp,
+                'body_file': ref.generation, 'body_offset': ref.offset, 'body_length': ref.length,
+                '_v': self.versions.get(record.id, 0)}
+
+    def _store_bodies(self, records):
+        # тексты новых и изменённых заметок дописываются до ссылок на них
+        written = [record for record in records if self.body_field.ref(record) is None]
+        if written:
+            for record, ref in zip(written, self.bodies.append([record.content for record in written])):
+                self.body_field.set_ref(record, ref)
+
+    def save(self, records, replace=False):
+        self._store_bodies(records)
+        super().save(records, replace)
+
+    def apply(self, records, changed, deleted):
+        # мусор в файле текстов появляется только от изменённых и удалённых
+        # заметок, а не от новых (пакетная запись при импорте)
+        replaced = bool(deleted) or any(record.id in self.versions for record in changed)
+        self._store_bodies(changed)
+        super().apply(records, changed, deleted)
+        if replaced and self.needs_body_compaction(records):
+            self.compact(records)
+
+    def needs_body_compaction(self, records):
+        generation = self.bodies.current()
+        try:
+            size = os.path.getsize(self.bodies.path(generation))
+        except FileNotFoundError:
+            return False
+        return (size >= BODIES_MIN_BYTES
+                and self.bodies.live_bytes(records, self.body_field, generation) < BODIES_RATIO * size)
+
+    def compact(self, records):
+        # Под эксклюзивной блокировкой; records — вся коллекция. Версии
+        # записей не меняются: тексты те же, меняются только ссылки.
+        generation = self.bodies.current() + 1
+        records = list(records)
+        refs = self.bodies.append([record.content for record in records], generation)
+        for record, ref in zip(records, refs):
+            self.body_field.set_ref(record, ref)
+        self.save(records)
+        self.bodies.drop_before(generation - 1)
+
+
+def compact(repo):
+    # (байт во всех файлах текстов до компакции, в новом файле после неё)
+    repo.flush()
+    store = repo.store
+    with store.lock():
+        records = repo.load()
+        before = store.bodies.size()
+        store.compact(records)
+        repo.signature = repo.current_signature()
+        after = os.path.getsize(store.bodies.path(store.bodies.current()))
+    for listener in repo.listeners:
+        flushed = getattr(listener, 'records_flushed', None)
+        if flushed is not None:
+            flushed()
+    return before, after
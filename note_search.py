@@ -0,0 +1,276 @@
+import os
+import re
+import json
+import math
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r'\w+')
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Упрощённый стеммер для русского: окончания прилагательных, глаголов,
+# существительных и возвратные частицы. Отрезается самое длинное окончание,
+# если от слова остаётся не меньше MIN_STEM букв.
+REFLEXIVE = ('ся', 'сь')
+ENDINGS = sorted({
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+    'ла', 'на', 'ете', 'йте', 'ли', 'л', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь',
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ил', 'ыл', 'ен', 'ило',
+    'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь',
+    'а', 'ев', 'ов', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'й',
+    'иям', 'ям', 'ием', 'ам', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью',
+    'ю', 'ия', 'ья', 'я',
+}, key=len, reverse=True)
+MIN_STEM = 3
+
+TITLE_BOOST = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+
+def normalize(word):
+    return word.casefold().replace('ё', 'е')
+
+
+def stem(word):
+    word = normalize(word)
+    if not CYRILLIC_RE.search(word):
+        return word
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for suffix in ENDINGS:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in TOKEN_RE.findall(text)]
+
+
+def parse_query(query):
+    # "фраза" -> ('phrase', [основы]), слово* -> ('prefix', начало),
+    # остальное -> ('term', основа)
+    clauses = []
+    for phrase, word in QUERY_RE.findall(query):
+        if phrase:
+            terms = tokenize(phrase)
+            if terms:
+                clauses.append(('phrase', terms))
+        elif word.endswith('*') and TOKEN_RE.fullmatch(word[:-1]):
+            clauses.append(('prefix', normalize(word[:-1])))
+        else:
+            clauses.extend(('term', term) for term in tokenize(word))
+    return clauses
+
+
+def json_signature(signature):
+    return json.loads(json.dumps(signature))
+
+
+class NoteIndex:
+    # Инвертированный индекс по заголовку и тексту заметок. Обновляется
+    # по уведомлениям репозитория и сохраняется в файл вместе с подписью
+    # коллекции заметок (в SQLite — счётчик записей её таблицы, а не всей
+    # базы, чтобы запись задач или финансов не сбрасывала индекс); если при
+    # запуске подпись не совпала, индекс строится заново.
+    def __init__(self, path, repo):
+        self.path = path
+        self.repo = repo
+        self.docs = {}
+        self.postings = {}
+        self.total_length = 0
+        self.vocabulary = None
+        self.signature = None
+        self.loaded = False
+        self.dirty = False
+        repo.subscribe(self)
+
+    def ensure(self):
+        current = json_signature(self.repo.current_signature())
+        if self.loaded and current == self.signature:
+            return
+        if self.loaded or not self.read(current):
+            self.rebuild()
+        self.loaded = True
+
+    def read(self, current):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION or data.get('signature') != current:
+            return False
+        self.clear()
+        for note_id, (title_length, length, terms) in data['docs'].items():
+            self._insert(int(note_id), title_length, length, terms)
+        self.signature = current
+        self.dirty = False
+        return True
+
+    def rebuild(self):
+        self.clear()
+        for note in self.repo.iter():
+            self._add(note)
+        self.signature = json_signature(self.repo.current_signature())
+        self.dirty = True
+
+    def clear(self):
+        self.docs = {}
+        self.postings = {}
+        self.total_length = 0
+        self.vocabulary = None
+
+    def flush(self):
+        if not (self.loaded and self.dirty):
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'signature': self.signature,
+            'docs': {note_id: [title_length, length, terms]
+                     for note_id, (title_length, length, terms) in self.docs.items()},
+        }
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def _add(self, note):
+        title_terms = tokenize(note.title)
+        content_terms = tokenize(note.content)
+        terms = {}
+        # между заголовком и текстом пропуск в одну позицию, чтобы фраза
+        # не склеивалась через границу полей
+        for position, term in enumerate(title_terms):
+            terms.setdefault(term, []).append(position)
+        offset = len(title_terms) + 1
+        for position, term in enumerate(content_terms):
+            terms.setdefault(term, []).append(offset + position)
+        self._insert(note.id, len(title_terms), len(title_terms) + len(content_terms), terms)
+
+    def _insert(self, note_id, title_length, length, terms):
+        self.docs[note_id] = (title_length, length, terms)
+        self.total_length += length
+        for term, positions in terms.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self.vocabulary = None
+            self.postings[term][note_id] = positions
+
+    def _remove(self, note_id):
+        doc = self.docs.pop(note_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc[1]
+        for term in doc[2]:
+            postings = self.postings[term]
+            del postings[note_id]
+            if not postings:
+                del self.postings[term]
+                self.vocabulary = None
+
+    def _touch(self):
+        self.signature = json_signature(self.repo.current_signature())
+        self.dirty = True
+
+    def records_put(self, notes):
+        if not self.loaded:
+            return
+        for note in notes:
+            self._remove(note.id)
+            self._add(note)
+        self._touch()
+
+    def records_deleted(self, note_ids):
+        if not self.loaded:
+            return
+        for note_id in note_ids:
+            self._remove(note_id)
+        self._touch()
+
+    def records_reset(self):
+        self.loaded = False
+
+    def records_flushed(self):
+        # отложенные изменения записаны: индекс уже их учитывает, меняется
+        # только подпись файлов
+        if self.loaded:
+            self._touch()
+
+    def _prefix_terms(self, prefix):
+        # В индексе основы, а начало слова в запросе целое: «заметка*» должно
+        # найти основу «заметк». Кандидаты ищутся по основе начала, и из них
+        # остаются продолжающие начало или сами являющиеся его началом.
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        start = stem(prefix)
+        terms = []
+        position = bisect_left(self.vocabulary, start)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(start):
+            term = self.vocabulary[position]
+            if term.startswith(prefix) or prefix.startswith(term):
+                terms.append(term)
+            position += 1
+        return terms
+
+    def _phrase_docs(self, terms):
+        candidates = None
+        for term in terms:
+            docs = set(self.postings.get(term, ()))
+            candidates = docs if candidates is None else candidates & docs
+        matched = set()
+        for note_id in candidates or ():
+            first = self.postings[terms[0]][note_id]
+            rest = [set(self.postings[term][note_id]) for term in terms[1:]]
+            if any(all(start + i + 1 in positions for i, positions in enumerate(rest)) for start in first):
+                matched.add(note_id)
+        return matched
+
+    def _term_scores(self, term, docs=None):
+        postings = self.postings.get(term, {})
+        count = len(self.docs)
+        idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+        average = self.total_length / count if count else 0
+        scores = {}
+        for note_id, positions in postings.items():
+            if docs is not None and note_id not in docs:
+                continue
+            title_length, length = self.docs[note_id][:2]
+            tf = len(positions) + (TITLE_BOOST - 1) * sum(1 for p in positions if p < title_length)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average) if average else BM25_K1
+            scores[note_id] = idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, limit=20):
+        # Все части запроса должны совпасть (И); результаты упорядочены по BM25
+        self.ensure()
+        total = None
+        for kind, value in parse_query(query):
+            if kind == 'phrase':
+                docs = self._phrase_docs(value)
+                clause = {}
+                for term in value:
+                    for note_id, score in self._term_scores(term, docs).items():
+                        clause[note_id] = clause.get(note_id, 0) + score
+            elif kind == 'prefix':
+                clause = {}
+                for term in self._prefix_terms(value):
+                    for note_id, score in self._term_scores(term).items():
+                        clause[note_id] = max(clause.get(note_id, 0), score)
+            else:
+                clause = self._term_scores(value)
+            if total is None:
+                total = clause
+            else:
+                total = {note_id: score + clause[note_id] for note_id, score in total.items() if note_id in clause}
+            if not total:
+                return []
+        if not total:
+            return []
+        ranked = sorted(total.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
@@ -0,0 +1,155 @@
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+PAGE_SIZE = int(os.environ.get('ASSISTANT_PAGE_SIZE', '20'))
+
+
+class IdOrder:
+    # Отсортированный массив id коллекции: страница по позиции берётся
+    # срезом за O(размер страницы), переход к id — бинарным поиском.
+    # Поддерживается по уведомлениям репозитория, как остальные индексы.
+    def __init__(self, repo):
+        self.repo = repo
+        self.ids = None
+        repo.subscribe(self)
+
+    def ensure(self):
+        items = self.repo.refresh()
+        if self.ids is None:
+            self.ids = array('q', sorted(items))
+        return items
+
+    def records_put(self, records):
+        if self.ids is None:
+            return
+        if len(records) > len(self.ids) // 8 + 64:
+            self.ids = None
+            return
+        for record in records:
+            position = bisect_left(self.ids, record.id)
+            if position == len(self.ids) or self.ids[position] != record.id:
+                self.ids.insert(position, record.id)
+
+    def records_deleted(self, record_ids):
+        if self.ids is None:
+            return
+        for record_id in record_ids:
+            position = bisect_left(self.ids, record_id)
+            if position < len(self.ids) and self.ids[position] == record_id:
+                del self.ids[position]
+
+    def records_reset(self):
+        self.ids = None
+
+    def __len__(self):
+        self.ensure()
+        return len(self.ids)
+
+    def page(self, position, size):
+        items = self.ensure()
+        return [items[record_id] for record_id in self.ids[position:position + size]]
+
+    def position_of(self, record_id):
+        # позиция записи с этим id или первой записи после него
+        self.ensure()
+        return bisect_left(self.ids, record_id)
+
+
+class SequenceSource:
+    # Постраничный просмотр готового списка (например, результата фильтра)
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def page(self, position, size):
+        return self.records[position:position + size]
+
+    def position_of(self, record_id):
+        for position, record in enumerate(self.records):
+            if record.id == record_id:
+                return position
+        return None
+
+
+class Columns:
+    # Компактное табличное представление: [(заголовок, функция, ширина)]
+    def __init__(self, columns):
+        self.columns = columns
+
+    def render(self, records):
+        header = ' '.join(title.ljust(width) for title, _, width in self.columns)
+        lines = [header, '-' * len(header)]
+        for record in records:
+            cells = []
+            for _, get, width in self.columns:
+                text = str(get(record)).replace('\n', ' ')
+                if len(text) > width:
+                    text = text[:width - 1] + '…'
+                cells.append(text.ljust(width))
+            lines.append(' '.join(cells).rstrip())
+        return lines
+
+
+def write_lines(lines, out=None):
+    # страница уходит в терминал одной записью, а не print на каждую строку
+    (out or sys.stdout).write('\n'.join(lines) + '\n')
+
+
+def browse(source, line_format, columns=None, title=None, page_size=None):
+    # Листает source страницами. Если всё помещается на одну страницу,
+    # выводит её и, когда есть табличный вид, предлагает только
+    # переключение вида; иначе сразу возвращается.
+    size = page_size or PAGE_SIZE
+    position = 0
+    table = False
+    while True:
+        total = len(source)
+        position = max(0, min(position, total - 1 if total else 0))
+        records = source.page(position, size)
+        lines = [] if title is None else ['', title]
+        lines += columns.render(records) if table and columns else [line_format(r) for r in records]
+        if total <= size and position == 0:
+            if not columns:
+                write_lines(lines)
+                return
+            lines.append("t — таблица/подробно, Enter — выход")
+            write_lines(lines)
+            if input("> ").strip() != 't':
+                return
+            table = not table
+            continue
+        lines.append(f"Записи {position + 1}–{position + len(records)} из {total}. "
+                     f"Enter — далее, p — назад, g ID — к записи, s N — размер страницы"
+                     f"{', t — таблица/подробно' if columns else ''}, q — выход")
+        write_lines(lines)
+        command = input("> ").strip()
+        if command in ('', 'n'):
+            if position + size >= total:
+                return
+            position += size
+        elif command == 'p':
+            position -= size
+        elif command == 't' and columns:
+            table = not table
+        elif command.startswith('g '):
+            try:
+                found = source.position_of(int(command[2:]))
+            except ValueError:
+                found = None
+            if found is None:
+                print("Запись не найдена.")
+            else:
+                position = found
+        elif command.startswith('s '):
+            try:
+                size = max(1, int(command[2:]))
+            except ValueError:
+                print("Нужно целое число.")
+        elif command == 'q':
+            return
+        else:
+            print("Неверная команда.")
@@ -1,9 +1,37 @@
 import os
-import json
-import csv
+import atexit
+from itertools import chain
 from datetime import datetime
 
+from storage import FileStore, Repository, ConflictError
+from sqlite_store import SqliteStore, Table
+import csv_import as check
+from csv_import import import_csv
+from csv_export import write_csv, export_changes
+from note_search import NoteIndex
+from note_bodies import NoteStore, BodyField
+from contact_search import ContactIndex
+from finance_index import LedgerIndex, LedgerQuery, date_ordinal, format_money
+from finance_columns import LedgerColumnsCache, HAS_NUMPY
+from finance_ledger import LedgerFile
+from record_fields import InternedField, DateField, TimestampField
+from calculator import evaluate
+from paging import IdOrder, SequenceSource, Columns, browse
+from task_query import TaskIndex, Status, Priority, Due, And, Or, run_query, overdue, due_this_week, due_before
+import instrumentation
+
+STORAGE_MODE = os.environ.get('ASSISTANT_STORAGE', 'json')
+FILE_FORMAT = os.environ.get('ASSISTANT_FORMAT', 'json')
+SQLITE_PATH = 'assistant_data.db'
+# контрольная точка выгрузки изменений коллекции
+EXPORT_CHECKPOINT = '{}_export.checkpoint'
+
 class Notes:
+    __slots__ = ('id', 'title', '_content', '_timestamp')
+    # в файловых режимах текст читается из файла текстов при обращении
+    content = BodyField()
+    timestamp = TimestampField()
+
     def __init__(self, id, title, content, timestamp):
         self.id = id
         self.title = title
@@ -28,6 +56,10 @@ class Notes:
         )
 
 class Tasks:
+    __slots__ = ('id', 'short_description', 'long_description', 'finished', '_priority', '_deadline')
+    priority = InternedField()
+    deadline = DateField()
+
     def __init__(self, id, short_description, long_description, finished, priority, deadline):
         self.id = id
         self.short_description = short_description
@@ -58,6 +90,8 @@ class Tasks:
         )
 
 class Contacts:
+    __slots__ = ('id', 'name', 'phone', 'email')
+
     def __init__(self, id, name, phone, email):
         self.id = id
         self.name = name
@@ -82,6 +116,10 @@ class Contacts:
         )
 
 class FinanceRecord:
+    __slots__ = ('id', 'amount', '_category', '_date', 'description')
+    category = InternedField()
+    date = DateField()
+
     def __init__(self, id, amount, category, date, description):
         self.id = id
         self.amount = amount
@@ -108,6 +146,76 @@ class FinanceRecord:
             description=data['description']
         )
 
+NOTES_TABLE = Table('notes', [('id', 'INTEGER'), ('title', 'TEXT'), ('content', 'TEXT'),
+                              ('timestamp', 'TEXT')])
+TASKS_TABLE = Table('tasks', [('id', 'INTEGER'), ('title', 'TEXT'), ('description', 'TEXT'),
+                              ('done', 'BOOLEAN'), ('priority', 'TEXT'), ('due_date', 'TEXT')],
+                    derived={'due_ord': ('INTEGER', lambda data: date_ordinal(data['due_date']))},
+                    indexes=['done', 'priority', 'due_ord'])
+CONTACTS_TABLE = Table('contacts', [('id', 'INTEGER'), ('name', 'TEXT'), ('phone', 'TEXT'),
+                                    ('email', 'TEXT')])
+FINANCE_TABLE = Table('finance', [('id', 'INTEGER'), ('amount', 'REAL'), ('category', 'TEXT'),
+                                  ('date', 'TEXT'), ('description', 'TEXT')],
+                      derived={'date_ord': ('INTEGER', lambda data: date_ordinal(data['date']))},
+                      indexes=['date_ord', 'category'])
+
+def make_repo(file_name, record_type, table, store_type=FileStore):
+    checkpoints = [EXPORT_CHECKPOINT.format(table.name)]
+    file_store = store_type(file_name, record_type, journaled=(STORAGE_MODE == 'journal'),
+                            binary=(FILE_FORMAT == 'binary'), export_checkpoints=checkpoints)
+    if STORAGE_MODE == 'sqlite':
+        return Repository(SqliteStore(SQLITE_PATH, table, record_type, migrate_from=file_store,
+                                      export_checkpoints=checkpoints), table.name)
+    return Repository(file_store, table.name)
+
+notes_repo = make_repo('notes_data.json', Notes, NOTES_TABLE, NoteStore)
+tasks_repo = make_repo('tasks_data.json', Tasks, TASKS_TABLE)
+contacts_repo = make_repo('contacts_data.json', Contacts, CONTACTS_TABLE)
+finance_repo = make_repo('finance_data.json', FinanceRecord, FINANCE_TABLE)
+
+notes_index = NoteIndex('notes_index.json', notes_repo)
+atexit.register(notes_index.flush)
+contacts_index = ContactIndex(contacts_repo)
+ledger_index = LedgerIndex(finance_repo)
+task_index = TaskIndex(tasks_repo)
+notes_order = IdOrder(notes_repo)
+tasks_order = IdOrder(tasks_repo)
+finance_order = IdOrder(finance_repo)
+ledger_columns = LedgerColumnsCache(finance_repo)
+ledger_file = LedgerFile('finance_data.ledger', finance_repo)
+ledger_query = LedgerQuery(finance_repo)
+
+def finance_totals():
+    # Пока финансы не загружены в память, итоги считаются запросами к базе
+    # (режим sqlite) или по отображённому файлу журнала без разбора записей;
+    # после загрузки — по ledger_index.
+    if finance_repo.loaded():
+        return ledger_index
+    if finance_repo.queryable():
+        return ledger_query
+    return ledger_file.get()
+
+def peek(records):
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return None
+    return chain([first], records)
+
+def changes_only():
+    return input("Только изменения с прошлой выгрузки изменений? (да/нет): ").strip().lower() == 'да'
+
+def export_changes_csv(file_name, repo, columns, name):
+    exported, deleted = export_changes(file_name, repo, [column for column, _ in columns],
+                                       EXPORT_CHECKPOINT.format(name))
+    print(f"Выгрузка изменений завершена. Изменённых записей: {exported}, удалённых: {deleted}")
+
+def parse_id(text):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
 def start_app():
     while True:
         print("\nПерсональный Ассистент")
@@ -119,32 +227,32 @@ def start_app():
         print("6. Завершить работу")
         action = input("Выберите номер действия: ")
 
-        if action == '1':
-            notes_interface()
-        elif action == '2':
-            tasks_interface()
-        elif action == '3':
-            contacts_interface()
-        elif action == '4':
-            finance_interface()
-        elif action == '5':
-            run_calculator()
-        elif action == '6':
-            print("Приложение завершено. Благодарим за использование!")
-            break
-        else:
-            print("Неверный ввод. Повторите попытку.")
+        try:
+            if action == '1':
+                notes_interface()
+            elif action == '2':
+                tasks_interface()
+            elif action == '3':
+                contacts_interface()
+            elif action == '4':
+                finance_interface()
+            elif action == '5':
+                run_calculator()
+            elif action == '6':
+                print("Приложение завершено. Благодарим за использование!")
+                break
+            else:
+                print("Неверный ввод. Повторите попытку.")
+        except ConflictError as e:
+            # другой сеанс успел изменить те же записи: данные уже
+            # перечитаны, остальные изменения сохранены
+            print(f"Не сохранено: {e}. Данные обновлены, повторите действие.")
 
 def load_notes():
-    if not os.path.exists('notes_data.json'):
-        return []
-    with open('notes_data.json', 'r', encoding='utf-8') as f:
-        content = json.load(f)
-        return [Notes.from_dict(m) for m in content]
+    return notes_repo.load()
 
 def save_notes(notes_list):
-    with open('notes_data.json', 'w', encoding='utf-8') as f:
-        json.dump([m.to_dict() for m in notes_list], f, ensure_ascii=False, indent=4)
+    notes_repo.save(notes_list)
 
 def notes_interface():
     while True:
@@ -156,7 +264,8 @@ def notes_interface():
         print("5. Удалить заметку")
         print("6. Импорт из CSV")
         print("7. Экспорт в CSV")
-        print("8. Вернуться назад")
+        print("8. Поиск заметок")
+        print("9. Вернуться назад")
         choice = input("Выберите действие: ")
 
         if choice == '1':
@@ -174,13 +283,15 @@ def notes_interface():
         elif choice == '7':
             export_notes_csv()
         elif choice == '8':
+            search_notes()
+        elif choice == '9':
+            notes_index.flush()
             break
         else:
             print("Неверный ввод. Повторите попытку.")
 
 def create_note():
-    all_notes = load_notes()
-    new_id = max((m.id for m in all_notes), default=0) + 1
+    new_id = notes_repo.next_id()
     title = input("Введите заголовок: ").strip()
     if not title:
         print("Заголовок не может быть пустым.")
@@ -188,100 +299,101 @@ def create_note():
     text = input("Введите содержимое: ")
     now_stamp = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
     new_note = Notes(new_id, title, text, now_stamp)
-    all_notes.append(new_note)
-    save_notes(all_notes)
+    notes_repo.put(new_note)
     print("Заметка добавлена.")
 
+NOTE_COLUMNS = Columns([('ID', lambda m: m.id, 7), ('Заголовок', lambda m: m.title, 40),
+                        ('Дата', lambda m: m.timestamp, 19)])
+
+def note_line(m):
+    return f"ID: {m.id}, Заголовок: {m.title}, Дата: {m.timestamp}"
+
 def show_all_notes():
-    notes_list = load_notes()
-    if not notes_list:
+    if not len(notes_order):
         print("Нет ни одной заметки.")
         return
-    print("\nСписок заметок:")
-    for m in notes_list:
-        print(f"ID: {m.id}, Заголовок: {m.title}, Дата: {m.timestamp}")
+    browse(notes_order, note_line, NOTE_COLUMNS, "Список заметок:")
 
 def show_single_note():
     note_id = input("Введите ID заметки: ")
-    notes_list = load_notes()
-    for m in notes_list:
-        if str(m.id) == note_id:
-            print(f"\nЗаголовок: {m.title}")
-            print(f"Содержимое: {m.content}")
-            print(f"Дата: {m.timestamp}")
-            return
-    print("Заметка не найдена.")
+    m = notes_repo.get(parse_id(note_id))
+    if m is None:
+        print("Заметка не найдена.")
+        return
+    print(f"\nЗаголовок: {m.title}")
+    print(f"Содержимое: {m.content}")
+    print(f"Дата: {m.timestamp}")
 
 def update_notes():
     note_id = input("Введите ID заметки для изменения: ")
-    notes_list = load_notes()
-    for m in notes_list:
-        if str(m.id) == note_id:
-            new_title = input(f"Новый заголовок (старый: {m.title}): ").strip()
-            if not new_title:
-                print("Заголовок не может быть пустым.")
-                return
-            new_text = input("Новое содержимое: ")
-            new_stamp = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
-            m.title = new_title
-            m.content = new_text
-            m.timestamp = new_stamp
-            save_notes(notes_list)
-            print("Заметка обновлена.")
-            return
-    print("Заметка не найдена.")
+    m = notes_repo.get(parse_id(note_id))
+    if m is None:
+        print("Заметка не найдена.")
+        return
+    new_title = input(f"Новый заголовок (старый: {m.title}): ").strip()
+    if not new_title:
+        print("Заголовок не может быть пустым.")
+        return
+    new_text = input("Новое содержимое: ")
+    new_stamp = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+    m.title = new_title
+    m.content = new_text
+    m.timestamp = new_stamp
+    notes_repo.put(m)
+    print("Заметка обновлена.")
 
 def remove_note():
     note_id = input("Введите ID для удаления: ")
-    notes_list = load_notes()
-    updated_notes = [m for m in notes_list if str(m.id) != note_id]
-    save_notes(updated_notes)
+    notes_repo.delete(parse_id(note_id))
     print("Заметка удалена.")
 
+def search_notes():
+    query = input("Поиск (слова, слово* для начала слова, \"фраза\" в кавычках): ").strip()
+    if not query:
+        print("Пустой запрос.")
+        return
+    # заметку могли удалить в другом сеансе уже после обновления индекса
+    results = [(notes_repo.get(note_id), score) for note_id, score in notes_index.search(query)]
+    results = [(m, score) for m, score in results if m is not None]
+    if not results:
+        print("Ничего не найдено.")
+        return
+    print("\nНайденные заметки:")
+    for m, score in results:
+        print(f"ID: {m.id}, Заголовок: {m.title}, Дата: {m.timestamp}, Релевантность: {score:.2f}")
+
+# колонки CSV и их проверки в порядке аргументов конструктора записи
+NOTE_CSV = [('id', check.integer), ('title', check.text), ('content', check.text),
+            ('timestamp', check.timestamp)]
+
 def import_notes_csv():
     file_name = input("Укажите CSV-файл для импорта: ")
     try:
-        with open(file_name, 'r', encoding='utf-8') as csv_file:
-            readr = csv.DictReader(csv_file)
-            existing = load_notes()
-            for row in readr:
-                imported = Notes(
-                    id=int(row['id']),
-                    title=row['title'],
-                    content=row['content'],
-                    timestamp=row['timestamp']
-                )
-                existing.append(imported)
-            save_notes(existing)
-            print("Импорт завершен.")
+        imported, duplicates, _ = import_csv(file_name, notes_repo, NOTE_CSV, Notes)
+        print(f"Импорт завершен. Добавлено заметок: {imported}")
+        if duplicates:
+            print(f"Пропущено записей с повторяющимся ID: {duplicates}")
     except Exception as e:
         print(f"Ошибка импорта: {e}")
 
 def export_notes_csv():
     file_name = input("Укажите CSV-файл для экспорта: ")
-    notes_list = load_notes()
-    if not notes_list:
+    if changes_only():
+        export_changes_csv(file_name, notes_repo, NOTE_CSV, 'notes')
+        return
+    notes_list = peek(notes_repo.iter())
+    if notes_list is None:
         print("Нет заметок для экспорта.")
         return
-    with open(file_name, 'w', newline='', encoding='utf-8') as csv_file:
-        fields = ['id', 'title', 'content', 'timestamp']
-        writr = csv.DictWriter(csv_file, fieldnames=fields)
-        writr.writeheader()
-        for m in notes_list:
-            writr.writerow(m.to_dict())
+    write_csv(file_name, notes_list, [column for column, _ in NOTE_CSV])
     print("Экспорт завершен.")
 
 
 def load_tasks():
-    if not os.path.exists('tasks_data.json'):
-        return []
-    with open('tasks_data.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        return [Tasks.from_dict(j) for j in data]
+    return tasks_repo.load()
 
 def save_tasks(tasks):
-    with open('tasks_data.json', 'w', encoding='utf-8') as f:
-        json.dump([j.to_dict() for j in tasks], f, ensure_ascii=False, indent=4)
+    tasks_repo.save(tasks)
 
 def tasks_interface():
     while True:
@@ -319,8 +431,7 @@ def tasks_interface():
             print("Неверный ввод.")
 
 def add_task():
-    tasks_list = load_tasks()
-    new_id = max((j.id for j in tasks_list), default=0) + 1
+    new_id = tasks_repo.next_id()
     title = input("Название задачи: ").strip()
     if not title:
         print("Название не может быть пустым.")
@@ -337,98 +448,88 @@ def add_task():
         print("Неверный формат даты.")
         return
     new_task = Tasks(new_id, title, desc, False, priority, due)
-    tasks_list.append(new_task)
-    save_tasks(tasks_list)
+    tasks_repo.put(new_task)
     print("Задача добавлена.")
 
+TASK_COLUMNS = Columns([('ID', lambda t: t.id, 7), ('Название', lambda t: t.short_description, 30),
+                        ('Готово', lambda t: '+' if t.finished else '', 6),
+                        ('Приоритет', lambda t: t.priority, 9), ('Срок', lambda t: t.deadline, 10)])
+
+def task_line(task):
+    status = "Выполнена" if task.finished else "Не выполнена"
+    return f"ID: {task.id}, Название: {task.short_description}, Статус: {status}, Приоритет: {task.priority}, Срок: {task.deadline}"
+
 def display_tasks():
-    tasks_list = load_tasks()
-    if not tasks_list:
+    if not len(tasks_order):
         print("Нет задач.")
         return
-    print("\nСписок задач:")
-    for task in tasks_list:
-        status = "Выполнена" if task.finished else "Не выполнена"
-        print(f"ID: {task.id}, Название: {task.short_description}, Статус: {status}, Приоритет: {task.priority}, Срок: {task.deadline}")
+    browse(tasks_order, task_line, TASK_COLUMNS, "Список задач:")
 
 def finish_task():
     task_id = input("ID задачи для отметки выполненной: ")
-    tasks_list = load_tasks()
-    for task in tasks_list:
-        if str(task.id) == task_id:
-            task.finished = True
-            save_tasks(tasks_list)
-            print("Отмечена как выполненная.")
-            return
-    print("Задача не найдена.")
+    task = tasks_repo.get(parse_id(task_id))
+    if task is None:
+        print("Задача не найдена.")
+        return
+    task.finished = True
+    tasks_repo.put(task)
+    print("Отмечена как выполненная.")
 
 def modify_task():
     task_id = input("ID задачи для изменения: ")
-    tasks_list = load_tasks()
-    for task in tasks_list:
-        if str(task.id) == task_id:
-            new_title = input(f"Новое название (старое: {task.short_description}): ")
-            if not new_title:
-                print("Название не может быть пустым.")
-                return
-            task.short_description = new_title
-            task.long_description = input("Новое описание: ")
-            new_priority = input(f"Новый приоритет (старый: {task.priority}): ")
-            if new_priority in ['Высокий', 'Средний', 'Низкий']:
-                task.priority = new_priority
-            else:
-                print("Приоритет не изменен из-за неверного ввода.")
-            new_due = input(f"Новый срок (старый: {task.deadline}): ")
-            try:
-                datetime.strptime(new_due, '%d-%m-%Y')
-                task.deadline = new_due
-            except ValueError:
-                print("Дата не изменена (неверный формат).")
-            save_tasks(tasks_list)
-            print("Задача обновлена.")
-            return
-    print("Задача не найдена.")
+    task = tasks_repo.get(parse_id(task_id))
+    if task is None:
+        print("Задача не найдена.")
+        return
+    new_title = input(f"Новое название (старое: {task.short_description}): ")
+    if not new_title:
+        print("Название не может быть пустым.")
+        return
+    task.short_description = new_title
+    task.long_description = input("Новое описание: ")
+    new_priority = input(f"Новый приоритет (старый: {task.priority}): ")
+    if new_priority in ['Высокий', 'Средний', 'Низкий']:
+        task.priority = new_priority
+    else:
+        print("Приоритет не изменен из-за неверного ввода.")
+    new_due = input(f"Новый срок (старый: {task.deadline}): ")
+    try:
+        datetime.strptime(new_due, '%d-%m-%Y')
+        task.deadline = new_due
+    except ValueError:
+        print("Дата не изменена (неверный формат).")
+    tasks_repo.put(task)
+    print("Задача обновлена.")
 
 def delete_task():
     task_id = input("ID задачи для удаления: ")
-    tasks_list = load_tasks()
-    filtered_tasks = [task for task in tasks_list if str(task.id) != task_id]
-    save_tasks(filtered_tasks)
+    tasks_repo.delete(parse_id(task_id))
     print("Задача удалена.")
 
+TASK_CSV = [('id', check.integer), ('title', check.required), ('description', check.text),
+            ('done', check.flag), ('priority', check.Choice(['Высокий', 'Средний', 'Низкий'])),
+            ('due_date', check.date)]
+
 def import_tasks_csv():
     file_name = input("CSV-файл для импорта: ")
     try:
-        with open(file_name, 'r', encoding='utf-8') as csv_file:
-            readr = csv.DictReader(csv_file)
-            exist = load_tasks()
-            for row in readr:
-                task = Tasks(
-                    id=int(row['id']),
-                    short_description=row['title'],
-                    long_description=row['description'],
-                    finished=(row['done'] == 'True'),
-                    priority=row['priority'],
-                    deadline=row['due_date']
-                )
-                exist.append(task)
-            save_tasks(exist)
-            print("Импорт завершен.")
+        imported, duplicates, _ = import_csv(file_name, tasks_repo, TASK_CSV, Tasks)
+        print(f"Импорт завершен. Добавлено задач: {imported}")
+        if duplicates:
+            print(f"Пропущено записей с повторяющимся ID: {duplicates}")
     except Exception as e:
         print(f"Ошибка импорта: {e}")
 
 def export_tasks_csv():
     file_name = input("CSV-файл для экспорта: ")
-    tasks_list = load_tasks()
-    if not tasks_list:
+    if changes_only():
+        export_changes_csv(file_name, tasks_repo, TASK_CSV, 'tasks')
+        return
+    tasks_list = peek(tasks_repo.iter())
+    if tasks_list is None:
         print("Нет задач для экспорта.")
         return
-    with open(file_name, 'w', newline='', encoding='utf-8') as csv_file:
-        fn = ['id','title','description','done','priority','due_date']
-        writr = csv.DictWriter(csv_file, fieldnames=fn)
-        writr.writeheader()
-        for task in tasks_list:
-            writr.writerow(task.to_dict())
+    write_csv(file_name, tasks_list, [column for column, _ in TASK_CSV])
     print("Экспорт завершен.")
 
 def filter_tasks():
@@ -436,42 +537,99 @@ def filter_tasks():
     print("1. По статусу")
     print("2. По приоритету")
     print("3. По сроку")
+    print("4. Просроченные")
+    print("5. Со сроком на этой неделе")
+    print("6. Со сроком до даты")
+    print("7. Составной фильтр")
     choice = input("Выберите фильтр: ")
-    tasks_list = load_tasks()
-    if not tasks_list:
-        print("Нет задач.")
-        return
+    order = 'deadline'
+    limit = None
+    offset = 0
     if choice == '1':
         st = input("Статус (Выполнена/Не выполнена): ")
-        desired = True if st == 'Выполнена' else False
-        subset = [task for task in tasks_list if task.finished == desired]
+        where = Status(st == 'Выполнена')
+        order = None
     elif choice == '2':
-        pr = input("Приоритет (Высокий/Средний/Низкий): ")
-        subset = [task for task in tasks_list if task.priority == pr]
+        where = Priority(input("Приоритет (Высокий/Средний/Низкий): "))
+        order = None
     elif choice == '3':
         dd = input("Срок (ДД-ММ-ГГГГ): ")
-        subset = [task for task in tasks_list if task.deadline == dd]
+        ordinal = date_ordinal(dd)
+        if ordinal is None:
+            print("Неверный формат даты.")
+            return
+        where = Due(ordinal, ordinal)
+        order = None
+    elif choice == '4':
+        where = overdue()
+    elif choice == '5':
+        where = due_this_week()
+    elif choice == '6':
+        ordinal = date_ordinal(input("Срок до (ДД-ММ-ГГГГ): "))
+        if ordinal is None:
+            print("Неверный формат даты.")
+            return
+        where = due_before(ordinal)
+    elif choice == '7':
+        query = ask_task_query()
+        if query is None:
+            return
+        where, order, limit, offset = query
     else:
         print("Неправильный выбор.")
         return
 
+    subset = run_query(task_index, where, order, limit, offset)
     if not subset:
-        print("Ничего не найдено по заданным критериям.")
+        # число задач проверяется только здесь: в режиме sqlite запрос
+        # выше не загружает коллекцию
+        print("Нет задач." if not len(tasks_repo) else "Ничего не найдено по заданным критериям.")
         return
-    for task in subset:
-        st = "Выполнена" if task.finished else "Не выполнена"
-        print(f"ID: {task.id}, Название: {task.short_description}, Статус: {st}, Приоритет: {task.priority}, Срок: {task.deadline}")
+    browse(SequenceSource(subset), task_line, TASK_COLUMNS)
+
+def ask_task_query():
+    # Пустой ответ означает «без ограничения»; условия объединяются по И,
+    # несколько приоритетов через запятую — по ИЛИ
+    parts = []
+    st = input("Статус (Выполнена/Не выполнена, пусто — любой): ").strip()
+    if st:
+        parts.append(Status(st == 'Выполнена'))
+    priorities = [p.strip() for p in input("Приоритеты через запятую (пусто — любые): ").split(',') if p.strip()]
+    if priorities:
+        parts.append(Or(*(Priority(p) for p in priorities)))
+    if input("Только просроченные? (да/нет): ").strip().lower() == 'да':
+        parts.append(overdue())
+    bounds = []
+    for prompt in ("Срок с (ДД-ММ-ГГГГ, пусто — без ограничения): ",
+                   "Срок по (ДД-ММ-ГГГГ, пусто — без ограничения): "):
+        text = input(prompt).strip()
+        ordinal = date_ordinal(text) if text else None
+        if text and ordinal is None:
+            print("Неверный формат даты.")
+            return None
+        bounds.append(ordinal)
+    if bounds != [None, None]:
+        parts.append(Due(*bounds))
+    order = {'1': 'deadline', '2': 'priority'}.get(
+        input("Сортировка (1 — по сроку, 2 — по приоритету, пусто — по ID): ").strip())
+    try:
+        limit = input("Сколько показать (пусто — все): ").strip()
+        limit = int(limit) if limit else None
+        offset = input("Сколько пропустить (пусто — 0): ").strip()
+        offset = int(offset) if offset else 0
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError
+    except ValueError:
+        print("Нужно целое число.")
+        return None
+    where = And(*parts) if parts else None
+    return where, order, limit, offset
 
 def load_contacts():
-    if not os.path.exists('contacts_data.json'):
-        return []
-    with open('contacts_data.json', 'r', encoding='utf-8') as f:
-        arr = json.load(f)
-        return [Contacts.from_dict(p) for p in arr]
+    return contacts_repo.load()
 
 def save_contacts(contacts_list):
-    with open('contacts_data.json', 'w', encoding='utf-8') as f:
-        json.dump([contact.to_dict() for contact in contacts_list], f, ensure_ascii=False, indent=4)
+    contacts_repo.save(contacts_list)
 
 def contacts_interface():
     while True:
@@ -502,8 +660,7 @@ def contacts_interface():
             print("Неверный ввод.")
 
 def add_contact():
-    contacts_list = load_contacts()
-    new_id = max((contact.id for contact in contacts_list), default=0) + 1
+    new_id = contacts_repo.next_id()
     name = input("Введите имя: ").strip()
     if not name:
         print("Имя не может быть пустым.")
@@ -511,14 +668,13 @@ def add_contact():
     phone = input("Телефон: ")
     email = input("Email: ")
     new_contact = Contacts(new_id, name, phone, email)
-    contacts_list.append(new_contact)
-    save_contacts(contacts_list)
+    contacts_repo.put(new_contact)
     print("Контакт добавлен.")
 
 def find_contact():
-    q = input("Введите имя или телефон для поиска: ").strip()
-    contacts_list = load_contacts()
-    matches = [contact for contact in contacts_list if q.lower() in contact.name.lower() or q in contact.phone]
+    q = input("Введите имя, телефон или email для поиска: ").strip()
+    # контакт мог быть удалён другим сеансом между поиском и чтением
+    matches = [contact for contact in map(contacts_repo.get, contacts_index.search(q)) if contact is not None]
     if not matches:
         print("Контакты не найдены.")
         return
@@ -528,73 +684,57 @@ def find_contact():
 
 def modify_contact():
     contact_id = input("ID контакта для изменения: ")
-    contacts_list = load_contacts()
-    for contact in contacts_list:
-        if str(contact.id) == contact_id:
-            new_name = input(f"Новое имя (старое: {contact.name}): ").strip()
-            if not new_name:
-                print("Имя не может быть пустым.")
-                return
-            new_phone = input(f"Новый телефон (старый: {contact.phone}): ")
-            new_mail = input(f"Новый email (старый: {contact.email}): ")
-            contact.name = new_name
-            contact.phone = new_phone
-            contact.email = new_mail
-            save_contacts(contacts_list)
-            print("Контакт обновлен.")
-            return
-    print("Контакт не найден.")
+    contact = contacts_repo.get(parse_id(contact_id))
+    if contact is None:
+        print("Контакт не найден.")
+        return
+    new_name = input(f"Новое имя (старое: {contact.name}): ").strip()
+    if not new_name:
+        print("Имя не может быть пустым.")
+        return
+    new_phone = input(f"Новый телефон (старый: {contact.phone}): ")
+    new_mail = input(f"Новый email (старый: {contact.email}): ")
+    contact.name = new_name
+    contact.phone = new_phone
+    contact.email = new_mail
+    contacts_repo.put(contact)
+    print("Контакт обновлен.")
 
 def remove_contact():
     contact_id = input("ID для удаления: ")
-    contacts_list = load_contacts()
-    filtered_contacts = [contact for contact in contacts_list if str(contact.id) != contact_id]
-    save_contacts(filtered_contacts)
+    contacts_repo.delete(parse_id(contact_id))
     print("Контакт удален.")
 
+CONTACT_CSV = [('id', check.integer), ('name', check.text), ('phone', check.text),
+               ('email', check.text)]
+
 def import_contacts_csv():
     file_name = input("CSV-файл для импорта: ")
     try:
-        with open(file_name, 'r', encoding='utf-8') as csv_file:
-            readr = csv.DictReader(csv_file)
-            existing = load_contacts()
-            for row in readr:
-                contact = Contacts(
-                    id=int(row['id']),
-                    name=row['name'],
-                    phone=row['phone'],
-                    email=row['email']
-                )
-                existing.append(contact)
-            save_contacts(existing)
-            print("Импорт контактов завершен.")
+        imported, duplicates, _ = import_csv(file_name, contacts_repo, CONTACT_CSV, Contacts)
+        print(f"Импорт контактов завершен. Добавлено контактов: {imported}")
+        if duplicates:
+            print(f"Пропущено записей с повторяющимся ID: {duplicates}")
     except Exception as e:
         print(f"Ошибка импорта: {e}")
 
 def export_contacts_csv():
     file_name = input("CSV-файл для экспорта: ")
-    contacts_list = load_contacts()
-    if not contacts_list:
+    if changes_only():
+        export_changes_csv(file_name, contacts_repo, CONTACT_CSV, 'contacts')
+        return
+    contacts_list = peek(contacts_repo.iter())
+    if contacts_list is None:
         print("Нет контактов для экспорта.")
         return
-    with open(file_name, 'w', newline='', encoding='utf-8') as csv_file:
-        fn = ['id','name','phone','email']
-        writr = csv.DictWriter(csv_file, fieldnames=fn)
-        writr.writeheader()
-        for contact in contacts_list:
-            writr.writerow(contact.to_dict())
+    write_csv(file_name, contacts_list, [column for column, _ in CONTACT_CSV])
     print("Экспорт завершен.")
 
 def load_finance():
-    if not os.path.exists('finance_data.json'):
-        return []
-    with open('finance_data.json', 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
-        return [FinanceRecord.from_dict(rec) for rec in raw_data]
+    return finance_repo.load()
 
 def save_finance(records):
-    with open('finance_data.json', 'w', encoding='utf-8') as f:
-        json.dump([record.to_dict() for record in records], f, ensure_ascii=False, indent=4)
+    finance_repo.save(records)
 
 def finance_interface():
     while True:
@@ -605,7 +745,8 @@ def finance_interface():
         print("4. Подсчёт общего баланса")
         print("5. Импорт из CSV")
         print("6. Экспорт в CSV")
-        print("7. Назад")
+        print("7. Аналитика по категориям и месяцам")
+        print("8. Назад")
         ch = input("Выберите действие: ")
         if ch == '1':
             add_finance_record()
@@ -620,13 +761,14 @@ def finance_interface():
         elif ch == '6':
             export_finance_csv()
         elif ch == '7':
+            finance_analytics()
+        elif ch == '8':
             break
         else:
             print("Неверный ввод.")
 
 def add_finance_record():
-    existing = load_finance()
-    new_id = max((record.id for record in existing), default=0) + 1
+    new_id = finance_repo.next_id()
     val = input("Сумма операции (+ доход, - расход): ")
     try:
         val = float(val)
@@ -642,18 +784,21 @@ def add_finance_record():
         return
     info = input("Описание: ")
     record = FinanceRecord(new_id, val, category, date, info)
-    existing.append(record)
-    save_finance(existing)
+    finance_repo.put(record)
     print("Операция добавлена.")
 
+FINANCE_COLUMNS = Columns([('ID', lambda r: r.id, 7), ('Сумма', lambda r: r.amount, 12),
+                           ('Категория', lambda r: r.category, 16), ('Дата', lambda r: r.date, 10),
+                           ('Описание', lambda r: r.description, 30)])
+
+def finance_line(record):
+    return f"ID: {record.id}, Сумма: {record.amount}, Категория: {record.category}, Дата: {record.date}, Описание: {record.description}"
+
 def show_finance_records():
-    records_list = load_finance()
-    if not records_list:
+    if not len(finance_order):
         print("Нет записей.")
         return
-    print("\nФинансовые записи:")
-    for record in records_list:
-        print(f"ID: {record.id}, Сумма: {record.amount}, Категория: {record.category}, Дата: {record.date}, Описание: {record.description}")
+    browse(finance_order, finance_line, FINANCE_COLUMNS, "Финансовые записи:")
 
 def generate_finance_report():
     start = input("Начальная дата (ДД-ММ-ГГГГ): ")
@@ -664,70 +809,100 @@ def generate_finance_report():
     except ValueError:
         print("Неверный формат даты.")
         return
-    records_list = load_finance()
-    filtered_records = [record for record in records_list if start_date <= datetime.strptime(record.date, '%d-%m-%Y') <= end_date]
-    if not filtered_records:
+    count, total_income, total_expense = finance_totals().period_totals(start_date.toordinal(), end_date.toordinal())
+    if not count:
         print("Нет данных за период.")
         return
-    total_income = sum(record.amount for record in filtered_records if record.amount > 0)
-    total_expense = sum(record.amount for record in filtered_records if record.amount < 0)
     print(f"\nОтчет с {start} по {end}:")
-    print(f"Доход: {total_income}")
-    print(f"Расход: {total_expense}")
-    print(f"Итоговый баланс: {total_income + total_expense}")
+    print(f"Доход: {format_money(total_income)}")
+    print(f"Расход: {format_money(total_expense)}")
+    print(f"Итоговый баланс: {format_money(total_income + total_expense)}")
 
 def calc_total_balance():
-    recs = load_finance()
-    balance = sum(record.amount for record in recs)
-    print(f"Текущий баланс: {balance}")
+    print(f"Текущий баланс: {format_money(finance_totals().balance())}")
+
+def finance_analytics():
+    if not HAS_NUMPY:
+        print("Для аналитики нужен пакет numpy (pip install numpy).")
+        return
+    start = input("Начальная дата (ДД-ММ-ГГГГ, Enter — без ограничения): ").strip()
+    end = input("Конечная дата (ДД-ММ-ГГГГ, Enter — без ограничения): ").strip()
+    start_ord = date_ordinal(start) if start else None
+    end_ord = date_ordinal(end) if end else None
+    if (start and start_ord is None) or (end and end_ord is None):
+        print("Неверный формат даты.")
+        return
+    columns = ledger_columns.get().filter(start_ord, end_ord)
+    if not len(columns):
+        print("Нет данных за период.")
+        return
+    print("\nПо категориям:")
+    for category, income, expense, count in columns.by_category():
+        print(f"{category}: доход {format_money(income)}, расход {format_money(expense)}, операций: {count}")
+    print("\nПо месяцам:")
+    for month, income, expense, count in columns.by_month():
+        print(f"{month.strftime('%m-%Y')}: доход {format_money(income)}, расход {format_money(expense)}, "
+              f"баланс {format_money(income + expense)}")
+    print("\nПо годам:")
+    for year, income, expense, count in columns.by_year():
+        print(f"{year.year}: доход {format_money(income)}, расход {format_money(expense)}, "
+              f"баланс {format_money(income + expense)}")
+    print("\nКрупнейшие категории расходов:")
+    for position, (category, expense) in enumerate(columns.top_expenses(), start=1):
+        print(f"{position}. {category}: {format_money(expense)}")
+
+FINANCE_CSV = [('id', check.integer), ('amount', check.number), ('category', check.text),
+               ('date', check.date), ('description', check.text)]
 
 def import_finance_csv():
     file_name = input("CSV-файл для импорта: ")
     try:
-        with open(file_name, 'r', encoding='utf-8') as csv_file:
-            readr = csv.DictReader(csv_file)
-            existing = load_finance()
-            for row in readr:
-                new_record = FinanceRecord(
-                    id=int(row['id']),
-                    amount=float(row['amount']),
-                    category=row['category'],
-                    date=row['date'],
-                    description=row['description']
-                )
-                existing.append(new_record)
-            save_finance(existing)
-            print("Импорт выполнен.")
+        imported, duplicates, _ = import_csv(file_name, finance_repo, FINANCE_CSV, FinanceRecord)
+        print(f"Импорт выполнен. Добавлено операций: {imported}")
+        if duplicates:
+            print(f"Пропущено записей с повторяющимся ID: {duplicates}")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def export_finance_csv():
     file_name = input("CSV-файл для экспорта: ")
-    records_list = load_finance()
-    if not records_list:
+    if changes_only():
+        export_changes_csv(file_name, finance_repo, FINANCE_CSV, 'finance')
+        return
+    records_list = peek(finance_repo.iter())
+    if records_list is None:
         print("Нет данных для экспорта.")
         return
-    with open(file_name, 'w', newline='', encoding='utf-8') as csv_file:
-        fn = ['id','amount','category','date','description']
-        writr = csv.DictWriter(csv_file, fieldnames=fn)
-        writr.writeheader()
-        for record in records_list:
-            writr.writerow(record.to_dict())
+    write_csv(file_name, records_list, [column for column, _ in FINANCE_CSV])
     print("Экспорт выполнен.")
 
 def run_calculator():
     print("\nКалькулятор")
     expr = input("Введите выражение: ")
     try:
-        valid_chars = set('0123456789+-*/(). ')
-        if not set(expr).issubset(valid_chars):
-            raise ValueError("Недопустимые символы в выражении.")
-        result = eval(expr, {"__builtins__": None}, {})
+        result = evaluate(expr)
         print("Результат:", result)
     except ZeroDivisionError:
         print("Ошибка: деление на ноль.")
     except Exception as e:
         print(f"Ошибка в выражении: {e}")
 
+# действия меню, которые при включённой статистике оборачиваются замером
+# времени; чтение и запись коллекций (load_<коллекция>, save_<коллекция>)
+# замеряет сам Repository
+INSTRUMENTED = (
+    'create_note', 'show_all_notes', 'show_single_note', 'update_notes',
+    'remove_note', 'search_notes', 'import_notes_csv', 'export_notes_csv',
+    'add_task', 'display_tasks', 'finish_task', 'modify_task', 'delete_task',
+    'import_tasks_csv', 'export_tasks_csv', 'filter_tasks',
+    'add_contact', 'find_contact', 'modify_contact', 'remove_contact',
+    'import_contacts_csv', 'export_contacts_csv',
+    'add_finance_record', 'show_finance_records', 'generate_finance_report',
+    'calc_total_balance', 'finance_analytics', 'import_finance_csv', 'export_finance_csv',
+    'run_calculator',
+)
+
 if __name__ == "__main__":
+    if instrumentation.requested():
+        instrumentation.enable(globals(), INSTRUMENTED)
     start_app()
\ No newline at end of file
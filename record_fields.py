@@ -0,0 +1,100 @@
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_date(text):
+    # 'ДД-ММ-ГГГГ' -> ordinal; строка, которая не разбирается или записана
+    # не в каноническом виде, хранится как есть, чтобы to_dict вернул её же
+    if not isinstance(text, str):
+        return text
+    return encode_date_text(text)
+
+
+# различных дат немного, а записей с ними — сотни тысяч
+@lru_cache(maxsize=65536)
+def encode_date_text(text):
+    if len(text) != 10 or text[2] != '-' or text[5] != '-':
+        return text
+    try:
+        value = date(int(text[6:]), int(text[3:5]), int(text[:2]))
+    except ValueError:
+        return text
+    if decode_date(value.toordinal()) != text:
+        return text
+    return value.toordinal()
+
+
+@lru_cache(maxsize=65536)
+def decode_date(ordinal):
+    value = date.fromordinal(ordinal)
+    return f"{value.day:02d}-{value.month:02d}-{value.year:04d}"
+
+
+def encode_timestamp(text):
+    # 'ДД-ММ-ГГГГ ЧЧ:ММ:СС' -> секунды от 1970-01-01
+    if not isinstance(text, str) or len(text) != 19 or text[10] != ' ':
+        return text
+    day = encode_date(text[:10])
+    if not isinstance(day, int) or text[13] != ':' or text[16] != ':':
+        return text
+    try:
+        hours, minutes, seconds = int(text[11:13]), int(text[14:16]), int(text[17:])
+    except ValueError:
+        return text
+    value = (day - EPOCH.toordinal()) * 86400 + hours * 3600 + minutes * 60 + seconds
+    if decode_timestamp(value) != text:
+        return text
+    return value
+
+
+def decode_timestamp(value):
+    days, seconds = divmod(value, 86400)
+    return (f"{decode_date(EPOCH.toordinal() + days)} "
+            f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}")
+
+
+class SlotField:
+    # Поле поверх слота '_<имя>': значение хранится в компактном виде
+    # и преобразуется обратно при чтении.
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return self.decode(getattr(obj, self.slot))
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, self.encode(value))
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+
+class InternedField(SlotField):
+    # Для полей с небольшим набором значений (приоритет, категория): все
+    # записи ссылаются на один и тот же объект строки.
+    def encode(self, value):
+        return sys.intern(value) if isinstance(value, str) else value
+
+
+class DateField(SlotField):
+    def encode(self, value):
+        return encode_date(value)
+
+    def decode(self, value):
+        return decode_date(value) if isinstance(value, int) else value
+
+
+class TimestampField(SlotField):
+    def encode(self, value):
+        return encode_timestamp(value)
+
+    def decode(self, value):
+        return decode_timestamp(value) if isinstance(value, int) else value
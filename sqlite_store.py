@@ -0,0 +1,229 @@
+import sqlite3
+from contextlib import contextmanager
+
+from storage import file_signature, export_horizon
+from instrumentation import stats, file_size
+
+
+class Table:
+    # columns: [(ключ из to_dict, тип)], тип — INTEGER/REAL/TEXT/BOOLEAN.
+    # derived: {имя колонки: (тип, функция от словаря записи)} — служебные
+    # колонки только для поиска и сортировки (например, дата как ordinal).
+    def __init__(self, name, columns, derived=None, indexes=()):
+        self.name = name
+        self.columns = columns
+        self.derived = derived or {}
+        self.indexes = indexes
+
+    def column_names(self):
+        return [name for name, _ in self.columns] + list(self.derived)
+
+    def row(self, data):
+        values = [data[name] for name, _ in self.columns]
+        values += [fn(data) for _, fn in self.derived.values()]
+        return values
+
+
+class SqliteStore:
+    def __init__(self, db_path, table, record_type, migrate_from=None, export_checkpoints=()):
+        self.db_path = db_path
+        self.table = table
+        self.record_type = record_type
+        self.migrate_from = migrate_from
+        self.export_checkpoints = export_checkpoints
+        self.conn = None
+        self.next_id = 1
+        # версии записей (служебная колонка _v) и удалений (таблица
+        # deleted), как у FileStore; компакции здесь нет, и уже выгруженные
+        # удаления убираются из deleted при записи новых
+        self.seq = 0
+        self.versions = {}
+        self.lock_depth = 0
+
+    def connect(self):
+        if self.conn is None:
+            # сервер пишет отложенные изменения из потока (Committer), пока
+            # цикл событий ждёт; одновременно соединением пользуется один поток
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.create_schema()
+            if self.migrate_from is not None:
+                self.migrate(self.migrate_from)
+        return self.conn
+
+    def create_schema(self):
+        table = self.table
+        defs = []
+        for name, kind in table.columns:
+            sql_type = 'INTEGER' if kind == 'BOOLEAN' else kind
+            defs.append(f'{name} {sql_type} PRIMARY KEY' if name == 'id' else f'{name} {sql_type}')
+        defs += [f'{name} {kind}' for name, (kind, _) in table.derived.items()]
+        defs.append('_v INTEGER NOT NULL DEFAULT 0')
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table.name} ({", ".join(defs)})')
+            for column in table.indexes:
+                self.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_{table.name}_{column} ON {table.name} ({column})')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (tbl TEXT PRIMARY KEY, next_id INTEGER, migrated INTEGER)')
+            self.conn.execute('INSERT OR IGNORE INTO meta (tbl, next_id, migrated) VALUES (?, 1, 0)', (table.name,))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS deleted (tbl TEXT, id INTEGER, _v INTEGER)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_deleted_v ON deleted (tbl, _v)')
+            columns = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table.name})')}
+            if '_v' not in columns:
+                # базы, созданные до появления версий
+                self.conn.execute(f'ALTER TABLE {table.name} ADD COLUMN _v INTEGER NOT NULL DEFAULT 0')
+            if 'changes' not in {row[1] for row in self.conn.execute('PRAGMA table_info(meta)')}:
+                self.conn.execute('ALTER TABLE meta ADD COLUMN changes INTEGER NOT NULL DEFAULT 0')
+
+    def signature(self):
+        # Счётчик записей в эту таблицу. PRAGMA data_version здесь не
+        # годится: он меняется при записи в любую таблицу базы, и запись
+        # одной коллекции заставляла перечитывать остальные целиком.
+        return self.connect().execute('SELECT changes FROM meta WHERE tbl = ?', (self.table.name,)).fetchone()[0]
+
+    @contextmanager
+    def lock(self, exclusive=True):
+        # BEGIN IMMEDIATE: другие соединения ждут, пока мы сверяем версии
+        # и пишем; запись внутри (with conn) фиксирует транзакцию
+        conn = self.connect()
+        if self.lock_depth == 0 and exclusive and not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        self.lock_depth += 1
+        try:
+            yield
+        except BaseException:
+            if self.lock_depth == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.lock_depth -= 1
+        if self.lock_depth == 0 and conn.in_transaction:
+            conn.commit()
+
+    def catch_up(self, items):
+        # изменения других соединений подтягиваются перечитыванием
+        return None
+
+    def disk_signature(self):
+        return file_signature(self.db_path), file_signature(self.db_path + '-wal')
+
+    def _from_row(self, row):
+        data = {}
+        for (name, kind), value in zip(self.table.columns, row):
+            data[name] = bool(value) if kind == 'BOOLEAN' else value
+        return self.record_type.from_dict(data)
+
+    def _select(self, where='', params=()):
+        return list(self._iter_select(where, params))
+
+    def _iter_select(self, where='', params=()):
+        fields = ', '.join(name for name, _ in self.table.columns)
+        sql = f'SELECT {fields} FROM {self.table.name}'
+        if where:
+            sql += f' WHERE {where}'
+        for row in self.connect().execute(sql + ' ORDER BY rowid', params):
+            yield self._from_row(row)
+
+    def iter_records(self):
+        return self._iter_select()
+
+    def load(self):
+        self.load_versions()
+        records = self._select()
+        if stats.enabled:
+            stats.file_read(f'{self.db_path}:{self.table.name}', file_size(self.db_path), len(records))
+        return records
+
+    def load_versions(self):
+        conn = self.connect()
+        stored = conn.execute('SELECT next_id FROM meta WHERE tbl = ?', (self.table.name,)).fetchone()[0]
+        max_id = conn.execute(f'SELECT MAX(id) FROM {self.table.name}').fetchone()[0] or 0
+        self.next_id = max(stored, max_id + 1)
+        self.versions = dict(conn.execute(f'SELECT id, _v FROM {self.table.name}'))
+        last_deleted = conn.execute('SELECT MAX(_v) FROM deleted WHERE tbl = ?', (self.table.name,)).fetchone()[0]
+        self.seq = max(max(self.versions.values(), default=0), last_deleted or 0)
+
+    @contextmanager
+    def bulk(self):
+        # запись в базу и так идёт пачками, без переписывания таблицы
+        yield
+
+    def query(self, where, params=()):
+        return self._select(where, params)
+
+    def _write_rows(self, records):
+        names = self.table.column_names() + ['_v']
+        placeholders = ', '.join('?' for _ in names)
+        cursor = self.conn.executemany(
+            f'INSERT OR REPLACE INTO {self.table.name} ({", ".join(names)}) VALUES ({placeholders})',
+            (self.table.row(record.to_dict()) + [self.versions.get(record.id, 0)] for record in records))
+        if stats.enabled:
+            # объём записи в базу не отделить от остальных таблиц: считаются строки
+            stats.file_written(f'{self.db_path}:{self.table.name}', 0, max(cursor.rowcount, 0))
+
+    def _write_next_id(self, records):
+        for record in records:
+            self.next_id = max(self.next_id, record.id + 1)
+        # вызывается при каждой записи таблицы, в той же транзакции
+        self.conn.execute('UPDATE meta SET next_id = ?, changes = changes + 1 WHERE tbl = ?',
+                          (self.next_id, self.table.name))
+
+    def deleted_since(self, seq):
+        return dict(self.connect().execute('SELECT id, _v FROM deleted WHERE tbl = ? AND _v > ?',
+                                           (self.table.name, seq)))
+
+    def _write_deleted(self, record_ids):
+        tombstones = []
+        for record_id in record_ids:
+            self.versions.pop(record_id, None)
+            self.seq += 1
+            tombstones.append((self.table.name, record_id, self.seq))
+        if not tombstones:
+            return
+        self.conn.executemany('INSERT INTO deleted VALUES (?, ?, ?)', tombstones)
+        horizon = export_horizon(self.export_checkpoints, self.seq)
+        if horizon:
+            self.conn.execute('DELETE FROM deleted WHERE tbl = ? AND _v <= ?', (self.table.name, horizon))
+
+    def save(self, records, replace=False):
+        previous = self.versions
+        if replace:
+            self.versions = {}
+        for record in records:
+            if record.id not in self.versions:
+                self.seq += 1
+                self.versions[record.id] = self.seq
+        conn = self.connect()
+        with conn:
+            conn.execute(f'DELETE FROM {self.table.name}')
+            self._write_rows(records)
+            self._write_next_id(records)
+            if replace:
+                self._write_deleted([record_id for record_id in previous if record_id not in self.versions])
+
+    def apply(self, records, changed, deleted):
+        for record in changed:
+            self.seq += 1
+            self.versions[record.id] = self.seq
+        conn = self.connect()
+        with conn:
+            conn.executemany(f'DELETE FROM {self.table.name} WHERE id = ?', ((i,) for i in deleted))
+            self._write_deleted(deleted)
+            self._write_rows(changed)
+            self._write_next_id(changed)
+
+    def migrate(self, source):
+        # однократный перенос из JSON-файлов: после успешного переноса
+        # флаг migrated не даёт повторить его при следующем запуске
+        conn = self.conn
+        migrated = conn.execute('SELECT migrated FROM meta WHERE tbl = ?', (self.table.name,)).fetchone()[0]
+        if migrated:
+            return 0
+        records = source.load()
+        with conn:
+            self._write_rows(records)
+            self.next_id = max(self.next_id, source.next_id)
+            self._write_next_id(records)
+            conn.execute('UPDATE meta SET migrated = 1 WHERE tbl = ?', (self.table.name,))
+        return len(records)
@@ -0,0 +1,829 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # без fcntl (Windows) блокировки не действуют, остаётся проверка версий
+    fcntl = None
+
+from instrumentation import stats, file_size
+from binary_format import is_binary, iter_binary, write_binary
+
+JOURNAL_MAX_BYTES = 4 * 1024 * 1024
+JOURNAL_MIN_ENTRIES = 1000
+JOURNAL_RATIO = 0.5
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    # Читает JSON-массив по одному элементу, не загружая файл целиком:
+    # в памяти держится только текущий кусок файла и разбираемый элемент.
+    if not os.path.exists(path):
+        return
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        # start -> '[', first -> элемент или ']', item -> элемент, next -> ',' или ']'
+        state = 'start'
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos == len(buf):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    if state == 'start':
+                        return
+                    raise ValueError(f'{path}: неожиданный конец файла')
+                buf = chunk
+                pos = 0
+                continue
+            char = buf[pos]
+            if state == 'start':
+                if char != '[':
+                    raise ValueError(f'{path}: ожидался массив JSON')
+                pos += 1
+                state = 'first'
+            elif state == 'next' or (state == 'first' and char == ']'):
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError(f'{path}: ожидалась запятая')
+                pos += 1
+                state = 'item'
+            else:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        raise
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                if not isinstance(item, (dict, list)) and (end == len(buf) or buf[end] not in ' \t\r\n,]'):
+                    # число или литерал могли оборваться на границе куска
+                    chunk = f.read(chunk_size)
+                    if chunk:
+                        buf = buf[pos:] + chunk
+                        pos = 0
+                        continue
+                yield item
+                pos = end
+                state = 'next'
+
+
+def temp_path(path):
+    # у каждого процесса свой временный файл, чтобы параллельные записи
+    # не писали в один и тот же
+    return f'{path}.{os.getpid()}.tmp'
+
+
+# Записи — плоские словари, и разделитель элементов с отступом даёт тот же
+# текст, что indent=4, но кодирует его C-кодировщик json, а не построчный
+# питоновский, который включается при indent (в 2–3 раза медленнее).
+ITEM_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',\n        ', ': '))
+
+
+def write_json_array(path, items):
+    # Пишет элементы по мере поступления в том же виде, что json.dump(indent=4),
+    # во временный файл, который после fsync атомарно подменяет path: при
+    # сбое на диске остаётся либо прежний файл, либо новый целиком
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        count = 0
+        for item in items:
+            f.write(',\n    ' if count else '[\n    ')
+            f.write('{\n        ' + ITEM_ENCODER.encode(item)[1:-1] + '\n    }')
+            count += 1
+        f.write('\n]' if count else '[]')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def iter_snapshot(path):
+    # формат снимка определяется по первым байтам файла
+    if is_binary(path):
+        return iter_binary(path)
+    return iter_json_array(path)
+
+
+def read_json_dict(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def export_horizon(checkpoints, seq):
+    # Удаления с версией не новее результата выгрузке изменений больше не
+    # нужны: все её контрольные точки (<коллекция>_export.checkpoint) уже
+    # дальше. Пока какой-то контрольной точки нет или она новее данных
+    # (коллекция пересоздана), удаления хранятся все — во всех режимах
+    # одинаково, так что одна и та же история даёт одну и ту же выгрузку.
+    marks = []
+    for path in checkpoints:
+        if not os.path.exists(path):
+            return 0
+        marks.append(read_json_dict(path).get('seq', 0))
+    horizon = min(marks, default=0)
+    return 0 if horizon > seq else horizon
+
+
+def write_json_dict(path, data):
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FileStore:
+    # Снимок коллекции лежит в обычном JSON-файле. В журнальном режиме каждое
+    # изменение дописывается одной строкой в <имя>.journal, а снимок
+    # переписывается только при компакции. Записи журнала идемпотентны
+    # (put по id / del по id), поэтому сбой между записью снимка и очисткой
+    # журнала ничего не портит.
+    #
+    # Счётчик следующего id хранится в <имя>.meta.json и пишется вместе со
+    # снимком; между компакциями его восстанавливает повтор журнала.
+    #
+    # binary=True — снимок пишется в двоичном формате (binary_format.py);
+    # читаются оба формата, так что прежние JSON-файлы открываются как есть.
+    #
+    # С файлами могут работать несколько процессов: запись идёт под
+    # эксклюзивной блокировкой <имя>.lock (её берёт Repository), чтение —
+    # под разделяемой. У каждой записи есть версия (поле '_v' в файле) —
+    # значение монотонного счётчика seq коллекции на момент её изменения.
+    # Удаление тоже получает версию и дописывается в журнал удалений
+    # <имя>.deleted (строки {"id", "_v"}): по нему выгрузка изменений
+    # узнаёт об удалённых записях. При компакции из него убираются
+    # удаления, которые уже выгружены по всем export_checkpoints.
+    def __init__(self, path, record_type, journaled=False, binary=False, export_checkpoints=()):
+        self.path = path
+        self.record_type = record_type
+        self.journaled = journaled
+        self.binary = binary
+        self.export_checkpoints = export_checkpoints
+        base = os.path.splitext(path)[0]
+        self.journal_path = base + '.journal'
+        self.meta_path = base + '.meta.json'
+        self.deleted_path = base + '.deleted'
+        self.lock_path = base + '.lock'
+        self.lock_file = None
+        self.lock_depth = 0
+        self.journal_entries = 0
+        self.in_bulk = False
+        self.next_id = 1
+        self.seq = 0
+        self.versions = {}
+        # что из файлов уже прочитано: подпись снимка, inode журнала и
+        # позиция в нём, с которой начнётся следующее чтение
+        self.snapshot_signature = None
+        self.journal_inode = None
+        self.journal_offset = 0
+
+    def signature(self):
+        return file_signature(self.path), file_signature(self.journal_path)
+
+    def disk_signature(self):
+        return self.signature()
+
+    @contextmanager
+    def lock(self, exclusive=True):
+        # повторный вход из того же процесса (load() во время записи) не
+        # берёт блокировку заново
+        if self.lock_depth == 0:
+            self.lock_file = open(self.lock_path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self.lock_depth += 1
+        try:
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0:
+                self.lock_file.close()
+                self.lock_file = None
+
+    def load(self):
+        return list(self._scan({}).values())
+
+    def load_versions(self):
+        # как load(), но без сборки записей: пакетной записи новых записей
+        # (Repository.put_new) нужны только id и версии коллекции
+        self._scan(None)
+
+    def _scan(self, items):
+        # items — словарь для записей или None, если нужны только версии
+        from_dict = self._record
+        with self.lock(exclusive=False):
+            versions = self.versions = {}
+            self.snapshot_signature = file_signature(self.path)
+            for data in iter_snapshot(self.path):
+                if items is not None:
+                    items[data['id']] = from_dict(data)
+                versions[data['id']] = data.get('_v', 0)
+            meta = read_json_dict(self.meta_path)
+            self.next_id = max(meta.get('next_id', 1), max(versions, default=0) + 1)
+            self.seq = max(meta.get('seq', 0), max(versions.values(), default=0))
+            self.journal_entries = 0
+            self.journal_inode = None
+            self.journal_offset = 0
+            self._replay(items)
+        if stats.enabled:
+            stats.file_read(self.path, file_size(self.path) + file_size(self.journal_path), len(versions))
+        return items
+
+    def _replay(self, items):
+        # Применяет к items журнал с позиции journal_offset; возвращает id
+        # записанных и удалённых записей. items=None — только версии.
+        put, deleted = set(), set()
+        journal = file_signature(self.journal_path)
+        self.journal_inode = journal and journal[0]
+        from_dict = self._record
+        for entry, offset in self._read_journal(self.journal_offset):
+            self.journal_offset = offset
+            if entry['op'] == 'put':
+                data = entry['data']
+                self.versions[data['id']] = version = data.get('_v', 0)
+                self.seq = max(self.seq, version)
+                self.next_id = max(self.next_id, data['id'] + 1)
+                if items is not None:
+                    items[data['id']] = from_dict(data)
+                    put.add(data['id'])
+                    deleted.discard(data['id'])
+            elif entry['op'] == 'del':
+                self.versions.pop(entry['id'], None)
+                self.seq = max(self.seq, entry.get('_v', 0))
+                if items is not None:
+                    items.pop(entry['id'], None)
+                    deleted.add(entry['id'])
+                    put.discard(entry['id'])
+            self.journal_entries += 1
+        return put, deleted
+
+    def catch_up(self, items):
+        # Подтягивает в items изменения, которые другие процессы дописали в
+        # журнал после нашего чтения. None — снимок переписан (или режим не
+        # журнальный), и коллекцию нужно перечитать целиком.
+        if not self.journaled or file_signature(self.path) != self.snapshot_signature:
+            return None
+        journal = file_signature(self.journal_path)
+        if journal is None:
+            return None if self.journal_offset else (set(), set())
+        if (self.journal_inode and journal[0] != self.journal_inode) or journal[1] < self.journal_offset:
+            return None
+        return self._replay(items)
+
+    def _read_journal(self, offset=0):
+        # (запись, позиция после неё) для каждой целой строки начиная с offset
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            yield from self._journal_entries(f, offset)
+
+    def _journal_entries(self, f, offset):
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # недописанная строка: другой процесс ещё пишет её или
+                # работа завершилась аварийно
+                return
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield entry, offset
+
+    def iter_records(self):
+        # Потоковый обход без сборки всей коллекции: от журнала в памяти
+        # держатся только позиции строк с итоговым состоянием затронутых им
+        # записей, а сами записи дочитываются по позициям из того же
+        # открытого файла (после импорта журнал бывает большим).
+        try:
+            journal = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            journal = None
+        changes = {}
+        deleted = set()
+        if journal is not None:
+            start = 0
+            for entry, end in self._journal_entries(journal, 0):
+                if entry['op'] == 'put':
+                    record_id = entry['data']['id']
+                    if changes.get(record_id) is None:
+                        # после удаления запись снова встаёт в конец, как в load()
+                        changes.pop(record_id, None)
+                    changes[record_id] = start
+                elif entry['op'] == 'del':
+                    changes[entry['id']] = None
+                    deleted.add(entry['id'])
+                start = end
+
+        def journal_data(position):
+            journal.seek(position)
+            return json.loads(journal.readline())['data']
+
+        from_dict = self._record
+        count = 0
+        try:
+            for data in iter_snapshot(self.path):
+                if data['id'] in deleted:
+                    continue
+                if data['id'] in changes:
+                    data = journal_data(changes.pop(data['id']))
+                count += 1
+                yield from_dict(data)
+            for position in changes.values():
+                if position is not None:
+                    count += 1
+                    yield from_dict(journal_data(position))
+        finally:
+            if journal is not None:
+                journal.close()
+        if stats.enabled:
+            stats.file_read(self.path, file_size(self.path) + file_size(self.journal_path), count)
+
+    def _record(self, data):
+        return self.record_type.from_dict(data)
+
+    def _dict(self, record):
+        data = record.to_dict()
+        data['_v'] = self.versions.get(record.id, 0)
+        return data
+
+    def _stamp(self, changed, deleted):
+        # возвращает [(id, версия удаления)]
+        for record in changed:
+            self.next_id = max(self.next_id, record.id + 1)
+            self.seq += 1
+            self.versions[record.id] = self.seq
+        tombstones = []
+        for record_id in deleted:
+            self.versions.pop(record_id, None)
+            self.seq += 1
+            tombstones.append((record_id, self.seq))
+        return tombstones
+
+    def _log_deleted(self, tombstones):
+        if not tombstones:
+            return
+        with open(self.deleted_path, 'ab') as f:
+            f.write(''.join(json.dumps({'id': record_id, '_v': version}) + '\n'
+                            for record_id, version in tombstones).encode('utf-8'))
+
+    def deleted_since(self, seq):
+        # {id: версия удаления} для удалений новее seq
+        deleted = {}
+        if not os.path.exists(self.deleted_path):
+            return deleted
+        with open(self.deleted_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                if entry['_v'] > seq:
+                    deleted[entry['id']] = entry['_v']
+        return deleted
+
+    def _prune_deleted(self):
+        horizon = export_horizon(self.export_checkpoints, self.seq)
+        if not horizon or not os.path.exists(self.deleted_path):
+            return
+        with open(self.deleted_path, 'rb') as f:
+            lines = f.readlines()
+        # недописанная строка после сбоя отбрасывается, как в deleted_since
+        kept = [line for line in lines if line.endswith(b'\n') and json.loads(line)['_v'] > horizon]
+        if len(kept) == len(lines):
+            return
+        tmp_path = temp_path(self.deleted_path)
+        with open(tmp_path, 'wb') as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.deleted_path)
+
+    def save(self, records, replace=False):
+        # replace=True — коллекция заменяется целиком (Repository.save): все
+        # записи получают новые версии, а исчезнувшие считаются удалёнными
+        max_id = 0
+        previous = self.versions
+        if replace:
+            self.versions = {}
+
+        def dicts():
+            nonlocal max_id
+            for record in records:
+                max_id = max(max_id, record.id)
+                if record.id not in self.versions:
+                    self._stamp((record,), ())
+                yield self._dict(record)
+
+        count = (write_binary if self.binary else write_json_array)(self.path, dicts())
+        if stats.enabled:
+            stats.file_written(self.path, file_size(self.path), count)
+        if replace:
+            self._log_deleted(self._stamp((), [record_id for record_id in previous
+                                               if record_id not in self.versions]))
+        self.next_id = max(self.next_id, max_id + 1)
+        write_json_dict(self.meta_path, {'next_id': self.next_id, 'seq': self.seq})
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._prune_deleted()
+        self.snapshot_signature = file_signature(self.path)
+        self.journal_entries = 0
+        self.journal_inode = None
+        self.journal_offset = 0
+
+    def apply(self, records, changed, deleted):
+        # изменения (в том числе отложенной пачки Repository.defer) одной
+        # записью на диск; вызывается под блокировкой
+        tombstones = self._stamp(changed, deleted)
+        self._log_deleted(tombstones)
+        if not self.journaled:
+            self.save(records)
+            return
+        self._append([{'op': 'del', 'id': record_id, '_v': version} for record_id, version in tombstones] +
+                     [{'op': 'put', 'data': self._dict(record)} for record in changed], records)
+
+    def _append(self, entries, records):
+        if not entries:
+            return
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() > self.journal_offset:
+                # под блокировкой журнал дочитан до последней целой строки, а
+                # дальше только обрывок от процесса, упавшего посреди записи:
+                # строки после него читатели не увидели бы
+                f.truncate(self.journal_offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self.journal_inode = os.fstat(f.fileno()).st_ino
+        if stats.enabled:
+            stats.file_written(self.journal_path, len(data), len(entries))
+        # под блокировкой журнал дочитан до конца, так что наши строки
+        # идут сразу за прочитанными
+        self.journal_offset += len(data)
+        self.journal_entries += len(entries)
+        if not self.in_bulk and self.needs_compaction(len(records)):
+            self.save(records)
+
+    @contextmanager
+    def bulk(self):
+        # Пакетная запись (импорт): пачки и в режиме json дописываются в
+        # журнал, а снимок переписывается (потоком, без загрузки коллекции)
+        # один раз в конце, а не по мере роста журнала. Читатели применяют
+        # журнал в любом режиме.
+        journaled = self.journaled
+        self.journaled = self.in_bulk = True
+        try:
+            yield
+        finally:
+            self.journaled = journaled
+            self.in_bulk = False
+            with self.lock():
+                self.load_versions()
+                if not journaled and os.path.exists(self.journal_path) or self.needs_compaction(len(self.versions)):
+                    self.save(StoredRecords(self))
+
+    def needs_compaction(self, live_count):
+        if self.journal_entries == 0:
+            return False
+        if os.path.getsize(self.journal_path) >= JOURNAL_MAX_BYTES:
+            return True
+        return (self.journal_entries >= JOURNAL_MIN_ENTRIES
+                and self.journal_entries >= JOURNAL_RATIO * max(live_count, 1))
+
+
+class StoredRecords:
+    # Вся коллекция хранилища без загрузки в память: при пакетной записи
+    # снимок (компакция) пишется из записей, читаемых с диска потоком.
+    # Вызывается под блокировкой, когда версии хранилища актуальны.
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store.versions)
+
+    def __iter__(self):
+        return self.store.iter_records()
+
+
+class ConflictError(ValueError):
+    # запись изменена или удалена другим процессом после того, как её прочитали
+    def __init__(self, record_ids):
+        self.record_ids = sorted(record_ids)
+        super().__init__("записи изменены в другом сеансе: " + ', '.join(map(str, self.record_ids)))
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class Repository:
+    # Держит разобранную коллекцию в памяти на всю сессию в виде словаря
+    # id -> запись (порядок вставки сохраняется). Данные перечитываются,
+    # только если сменилась подпись хранилища: для файлов это inode, размер
+    # и mtime снимка и журнала, для SQLite — data_version базы.
+    #
+    # Подписчики (индексы поверх коллекции) получают records_put,
+    # records_deleted после записи и records_reset, когда коллекция
+    # перечитана с диска или заменена целиком.
+    #
+    # После defer() put и delete меняют только память, а на диск изменения
+    # уходят одной записью при flush(); до этого коллекция не перечитывается.
+    #
+    # Запись идёт под блокировкой хранилища (commit). Если файлы тем временем
+    # менял другой процесс, его изменения сначала подтягиваются, а записи,
+    # которые он изменил или удалил после нашего чтения, не перезаписываются:
+    # после сохранения остальных изменений поднимается ConflictError.
+    def __init__(self, store, name=None):
+        self.store = store
+        # имя коллекции для статистики: время чтения и записи попадает в
+        # операции load_<имя> и save_<имя>
+        self.name = name
+        self.items = None
+        self.signature = None
+        self.listeners = []
+        self.deferred = False
+        self.pending = {}
+        self.pending_next_id = 0
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def current_signature(self):
+        return self.store.signature()
+
+    def refresh(self):
+        if self.pending:
+            return self.items
+        signature = self.current_signature()
+        if self.items is None or signature != self.signature:
+            started = time.perf_counter()
+            self.items = {record.id: record for record in self.store.load()}
+            self._record_time('load', started)
+            self.signature = signature
+            for listener in self.listeners:
+                listener.records_reset()
+        return self.items
+
+    def load(self):
+        return list(self.refresh().values())
+
+    def loaded(self):
+        return self.items is not None
+
+    def iter(self):
+        # Если кэш актуален, обходит его; иначе читает хранилище потоком,
+        # не загружая коллекцию в память целиком.
+        if self.pending or (self.items is not None and self.current_signature() == self.signature):
+            return iter(list(self.items.values()))
+        return self.store.iter_records()
+
+    def queryable(self):
+        return hasattr(self.store, 'query')
+
+    def query(self, predicate, where=None, params=()):
+        # where — то же условие на SQL; если хранилище умеет запросы,
+        # фильтрация уходит в базу и использует её индексы
+        if where is not None and self.queryable():
+            return self.store.query(where, params)
+        return [record for record in self.iter() if predicate(record)]
+
+    def get(self, record_id):
+        return self.refresh().get(record_id)
+
+    def __contains__(self, record_id):
+        return record_id in self.refresh()
+
+    def __len__(self):
+        return len(self.refresh())
+
+    def next_id(self):
+        self.refresh()
+        return max(self.store.next_id, self.pending_next_id)
+
+    def save(self, records):
+        with self.store.lock():
+            # версии прежних записей нужны, чтобы отметить исчезнувшие удалёнными
+            self.refresh()
+            self.items = {record.id: record for record in records}
+            self.pending = {}
+            started = time.perf_counter()
+            self.store.save(self.items.values(), replace=True)
+            self._record_time('save', started)
+            self.signature = self.current_signature()
+        for listener in self.listeners:
+            listener.records_reset()
+
+    def put(self, *records):
+        if not records:
+            return
+        # уже загруженная коллекция здесь не перечитывается: версии, с
+        # которыми были прочитаны записи, нужны commit() для проверки
+        items = self.items if self.items is not None else self.refresh()
+        for record in records:
+            items[record.id] = record
+        if self.deferred:
+            for record in records:
+                self.pending[record.id] = record
+                self.pending_next_id = max(self.pending_next_id, record.id + 1)
+            for listener in self.listeners:
+                listener.records_put(records)
+            return
+        conflicts = self.commit(records, ())
+        written = [record for record in records if record.id not in conflicts]
+        if written:
+            for listener in self.listeners:
+                listener.records_put(written)
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    def delete(self, *record_ids):
+        items = self.refresh()
+        removed = [record_id for record_id in record_ids if items.pop(record_id, None) is not None]
+        if removed and self.deferred:
+            for record_id in removed:
+                self.pending[record_id] = None
+            for listener in self.listeners:
+                listener.records_deleted(removed)
+        elif removed:
+            conflicts = self.commit((), removed)
+            removed = [record_id for record_id in removed if record_id not in conflicts]
+            if removed:
+                for listener in self.listeners:
+                    listener.records_deleted(removed)
+            if conflicts:
+                raise ConflictError(conflicts)
+        return removed
+
+    def commit(self, changed, deleted):
+        # Пишет изменения под эксклюзивной блокировкой хранилища; возвращает
+        # id записей, не записанных из-за конфликта с другим процессом.
+        store = self.store
+        conflicts = set()
+        with store.lock():
+            if self.current_signature() != self.signature:
+                conflicts = self._merge(changed, deleted)
+                changed = [record for record in changed if record.id not in conflicts]
+                deleted = [record_id for record_id in deleted if record_id not in conflicts]
+            started = time.perf_counter()
+            store.apply(self.items.values(), changed, deleted)
+            self._record_time('save', started)
+            self.signature = self.current_signature()
+        return conflicts
+
+    def put_new(self, records):
+        # Пакетная запись новых записей (импорт) без загрузки коллекции в
+        # память: под блокировкой читаются только id и версии хранилища, а
+        # записи с уже занятыми id пропускаются. Кэш коллекции сбрасывается.
+        # Возвращает число записанных.
+        self.flush()
+        store = self.store
+        with store.lock():
+            if self.current_signature() != self.signature:
+                store.load_versions()
+            fresh = {}
+            for record in records:
+                if record.id not in store.versions:
+                    fresh[record.id] = record
+            started = time.perf_counter()
+            store.apply(StoredRecords(store), list(fresh.values()), ())
+            self._record_time('save', started)
+            self.signature = self.current_signature()
+        self.items = None
+        for listener in self.listeners:
+            listener.records_reset()
+        return len(fresh)
+
+    def bulk(self):
+        # на время пакетной записи (put_new пачками); см. FileStore.bulk
+        return self.store.bulk()
+
+    def _record_time(self, operation, started):
+        if stats.enabled and self.name is not None:
+            stats.record(f'{operation}_{self.name}', time.perf_counter() - started)
+
+    def _merge(self, changed, deleted):
+        # Подтягивает изменения другого процесса (хвост журнала или всю
+        # коллекцию) и сверяет версии записей, которые мы собираемся писать.
+        # Новая запись, чей id успел занять другой процесс, получает
+        # следующий свободный id.
+        store = self.store
+        base = {record.id: store.versions.get(record.id) for record in changed}
+        for record_id in deleted:
+            base[record_id] = store.versions.get(record_id)
+        base_next_id = store.next_id
+        update = store.catch_up(self.items)
+        if update is None:
+            self.items = {record.id: record for record in store.load()}
+        self.signature = self.current_signature()
+        conflicts = set()
+        for record_id, version in base.items():
+            current = store.versions.get(record_id)
+            if current != version and not (current is None and record_id in deleted):
+                conflicts.add(record_id)
+        moved = []
+        for record in changed:
+            if record.id in conflicts and base[record.id] is None and record.id >= base_next_id:
+                conflicts.discard(record.id)
+                record.id = store.next_id
+                store.next_id += 1
+                moved.append(record)
+        for record in changed:
+            if record.id not in conflicts:
+                self.items[record.id] = record
+        for record_id in deleted:
+            if record_id not in conflicts:
+                self.items.pop(record_id, None)
+        for listener in self.listeners:
+            if update is None:
+                listener.records_reset()
+                continue
+            put, removed = update
+            removed = [record_id for record_id in removed if record_id not in self.items]
+            put = [self.items[record_id] for record_id in put if record_id in self.items]
+            if removed:
+                listener.records_deleted(removed)
+            if put or moved:
+                listener.records_put(put + moved)
+        return conflicts
+
+    def changes_since(self, seq):
+        # (записи с версией новее seq в порядке изменения, {удалённый id:
+        # версия удаления}, текущий seq коллекции)
+        store = self.store
+        with store.lock(exclusive=False):
+            items = self.refresh()
+            versions = store.versions
+            changed = sorted((record for record in items.values() if versions.get(record.id, 0) > seq),
+                             key=lambda record: versions.get(record.id, 0))
+            deleted = {record_id: version for record_id, version in store.deleted_since(seq).items()
+                       if record_id not in items}
+            return changed, deleted, store.seq
+
+    def defer(self):
+        self.deferred = True
+
+    def flush(self):
+        if not self.pending:
+            return
+        changed, deleted = self.pending_changes()
+        self.flushed(self.commit(changed, deleted))
+
+    def pending_changes(self):
+        changed = [record for record in self.pending.values() if record is not None]
+        deleted = [record_id for record_id, record in self.pending.items() if record is None]
+        return changed, deleted
+
+    def commit_unmerged(self, records, changed, deleted):
+        # commit() без слияния, для записи из другого потока: records —
+        # снимок коллекции, который владелец не меняет до конца записи.
+        # Возвращает False, не записав ничего, если файлы менял другой
+        # процесс; тогда нужен обычный flush().
+        with self.store.lock():
+            if self.current_signature() != self.signature:
+                return False
+            started = time.perf_counter()
+            self.store.apply(records, changed, deleted)
+            self._record_time('save', started)
+            self.signature = self.current_signature()
+        return True
+
+    def flushed(self, conflicts):
+        # отложенные изменения сбрасываются только после записи: до этого
+        # refresh() не перечитывает файлы, а после ошибки записи flush()
+        # повторит их
+        self.pending = {}
+        self.store.next_id = max(self.store.next_id, self.pending_next_id)
+        for listener in self.listeners:
+            flushed = getattr(listener, 'records_flushed', None)
+            if flushed is not None:
+                flushed()
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    def invalidate(self):
+        self.pending = {}
+        self.items = None
+        self.signature = None
+        for listener in self.listeners:
+            listener.records_reset()
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Нагрузочная проверка совместной работы нескольких процессов с одним
+# каталогом данных. Каждый процесс создаёт, меняет и удаляет свои заметки
+# и дописывает метки в общие заметки, которые правят все. В конце
+# проверяется, что ни одно подтверждённое изменение не потеряно: свои
+# заметки совпадают с ожидаемыми, id не повторяются, в общих заметках есть
+# все метки успешных записей и нет меток записей, отклонённых конфликтом.
+#
+#   python stress_concurrency.py --workers 8 --ops 300 --storage json,journal
+
+SHARED_NOTES = 4
+
+
+def worker(number, ops, seed):
+    import personal_assistant as pa
+    from storage import ConflictError
+    rng = random.Random(f'{seed}-{number}')
+    own = {}
+    deleted = []
+    accepted, rejected = [], []
+    for i in range(ops):
+        action = rng.random()
+        if action < 0.35 or not own:
+            note = pa.Notes(pa.notes_repo.next_id(), f'w{number}-{i}', '', '01-01-2024 00:00:00')
+            pa.notes_repo.put(note)
+            # id мог смениться, если его успел занять другой процесс
+            own[note.id] = [note.title, '']
+        elif action < 0.6:
+            note_id = rng.choice(list(own))
+            note = pa.notes_repo.get(note_id)
+            note.content += f'{i};'
+            pa.notes_repo.put(note)
+            own[note_id][1] += f'{i};'
+        elif action < 0.7:
+            note_id = rng.choice(list(own))
+            pa.notes_repo.delete(note_id)
+            deleted.append(own.pop(note_id)[0])
+        else:
+            token = f'w{number}:{i};'
+            note = pa.notes_repo.get(rng.randint(1, SHARED_NOTES))
+            note.content += token
+            # пауза между чтением и записью, чтобы правки пересекались
+            time.sleep(rng.random() / 500)
+            try:
+                pa.notes_repo.put(note)
+                accepted.append(token)
+            except ConflictError:
+                rejected.append(token)
+    pa.notes_index.flush()
+    return {'own': dict(own.values()), 'deleted': deleted, 'accepted': accepted, 'rejected': rejected}
+
+
+def verify(results):
+    import personal_assistant as pa
+    notes = pa.notes_repo.load()
+    errors = []
+    by_title = {}
+    for note in notes:
+        if note.title in by_title:
+            errors.append(f"заголовок {note.title} встречается дважды")
+        by_title[note.title] = note
+    for result in results:
+        for title, content in result['own'].items():
+            note = by_title.get(title)
+            if note is None:
+                errors.append(f"потеряна заметка {title}")
+            elif note.content != content:
+                errors.append(f"заметка {title}: {note.content!r} вместо {content!r}")
+        for title in result['deleted']:
+            if title in by_title:
+                errors.append(f"удалённая заметка {title} вернулась")
+    shared = ''.join(by_title[f'shared-{i}'].content for i in range(1, SHARED_NOTES + 1))
+    for result in results:
+        errors += [f"потеряна метка {token}" for token in result['accepted'] if token not in shared]
+        errors += [f"записана отклонённая метка {token}" for token in result['rejected'] if token in shared]
+    return len(notes), errors
+
+
+def run(storage, workers, ops, seed):
+    workdir = tempfile.mkdtemp(prefix='assistant-stress-')
+    env = dict(os.environ, ASSISTANT_STORAGE=storage,
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        setup = [sys.executable, os.path.abspath(__file__), '--setup']
+        subprocess.run(setup, check=True, cwd=workdir, env=env)
+        started = time.perf_counter()
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', str(number),
+                                       '--ops', str(ops), '--seed', str(seed)],
+                                      cwd=workdir, env=env, stdout=subprocess.PIPE)
+                     for number in range(workers)]
+        results = []
+        for process in processes:
+            output = process.communicate()[0]
+            if process.returncode != 0:
+                raise SystemExit(f"процесс завершился с кодом {process.returncode}")
+            results.append(json.loads(output))
+        elapsed = time.perf_counter() - started
+        check = subprocess.run([sys.executable, os.path.abspath(__file__), '--verify'], input=json.dumps(results),
+                               cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True)
+        count, errors = json.loads(check.stdout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    accepted = sum(len(result['accepted']) for result in results)
+    rejected = sum(len(result['rejected']) for result in results)
+    print(f"{storage}: {workers} процессов x {ops} операций за {elapsed:.2f} с, заметок {count}, "
+          f"правок общих заметок {accepted}, отклонено конфликтом {rejected}")
+    for error in errors[:20]:
+        print(f"  ОШИБКА: {error}")
+    return not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельная запись несколькими процессами")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', default='json,journal', help="режимы хранения через запятую")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--setup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--verify', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.setup:
+        import personal_assistant as pa
+        pa.notes_repo.save([pa.Notes(i, f'shared-{i}', '', '01-01-2024 00:00:00')
+                            for i in range(1, SHARED_NOTES + 1)])
+        return 0
+    if args.worker is not None:
+        json.dump(worker(args.worker, args.ops, args.seed), sys.stdout)
+        return 0
+    if args.verify:
+        json.dump(verify(json.load(sys.stdin)), sys.stdout)
+        return 0
+    ok = all([run(storage, args.workers, args.ops, args.seed) for storage in args.storage.split(',')])
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from finance_index import date_ordinal
+
+PRIORITY_RANK = {'Высокий': 0, 'Средний': 1, 'Низкий': 2}
+NO_DEADLINE = 1 << 30
+
+
+class TaskIndex:
+    # Вторичные индексы по задачам: множества id по статусу и приоритету
+    # и массивы (ordinal срока, id), упорядоченные по сроку, для запросов
+    # по диапазону дат. Задачи с неразборчивым сроком попадают только
+    # в undated. Индексы обновляются по уведомлениям репозитория.
+    def __init__(self, repo):
+        self.repo = repo
+        self.status = None
+        self.priority = None
+        self.ordinals = None
+        self.ids = None
+        self.deadlines = None
+        self.undated = None
+        repo.subscribe(self)
+
+    def ensure(self):
+        # refresh сбросит индекс, если файл задач изменился на диске
+        items = self.repo.refresh()
+        if self.status is None:
+            self.rebuild(items.values())
+        return items
+
+    def rebuild(self, tasks):
+        self.status = {True: set(), False: set()}
+        self.priority = {}
+        self.deadlines = {}
+        self.undated = set()
+        rows = []
+        for task in tasks:
+            self._add_keys(task)
+            ordinal = date_ordinal(task.deadline)
+            if ordinal is None:
+                self.undated.add(task.id)
+            else:
+                self.deadlines[task.id] = ordinal
+                rows.append((ordinal, task.id))
+        rows.sort()
+        self.ordinals = array('i', (row[0] for row in rows))
+        self.ids = array('q', (row[1] for row in rows))
+
+    def _add_keys(self, task):
+        self.status.setdefault(bool(task.finished), set()).add(task.id)
+        self.priority.setdefault(task.priority, set()).add(task.id)
+
+    def _remove(self, task_id):
+        # запись могла быть изменена на месте, поэтому прежние ключи
+        # ищутся по id во всех множествах (их всего несколько)
+        for ids in self.status.values():
+            ids.discard(task_id)
+        for ids in self.priority.values():
+            ids.discard(task_id)
+        self.undated.discard(task_id)
+        ordinal = self.deadlines.pop(task_id, None)
+        if ordinal is not None:
+            position = bisect_left(self.ordinals, ordinal)
+            while self.ids[position] != task_id:
+                position += 1
+            del self.ordinals[position]
+            del self.ids[position]
+
+    def _add(self, task):
+        self._add_keys(task)
+        ordinal = date_ordinal(task.deadline)
+        if ordinal is None:
+            self.undated.add(task.id)
+            return
+        self.deadlines[task.id] = ordinal
+        position = bisect_right(self.ordinals, ordinal)
+        self.ordinals.insert(position, ordinal)
+        self.ids.insert(position, task.id)
+
+    def records_put(self, tasks):
+        if self.status is None:
+            return
+        if len(tasks) > len(self.deadlines) // 8 + 64:
+            self.rebuild(self.repo.refresh().values())
+            return
+        for task in tasks:
+            self._remove(task.id)
+            self._add(task)
+
+    def records_deleted(self, task_ids):
+        if self.status is None:
+            return
+        for task_id in task_ids:
+            self._remove(task_id)
+
+    def records_reset(self):
+        self.status = None
+
+    def all_ids(self):
+        return set(self.deadlines) | self.undated
+
+    def due_between(self, start=None, end=None):
+        # срок в [start, end], границы — ordinal даты или None
+        lo = 0 if start is None else bisect_left(self.ordinals, start)
+        hi = len(self.ordinals) if end is None else bisect_right(self.ordinals, end)
+        return set(self.ids[lo:hi])
+
+    def sort_key(self, order):
+        deadlines = self.deadlines
+        if order == 'deadline':
+            return lambda task_id: (deadlines.get(task_id, NO_DEADLINE), task_id)
+        if order == 'priority':
+            priority = {task_id: PRIORITY_RANK.get(name, len(PRIORITY_RANK))
+                        for name, ids in self.priority.items() for task_id in ids}
+            return lambda task_id: (priority[task_id], deadlines.get(task_id, NO_DEADLINE), task_id)
+        return None
+
+
+class Where:
+    # Условие запроса: ids(index) возвращает множество подходящих id,
+    # sql() — то же условие для хранилища с запросами (текст и параметры),
+    # matches(task) — для проверки задачи без индексов.
+    # Условия комбинируются операторами & (И) и | (ИЛИ).
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+
+class Status(Where):
+    def __init__(self, finished):
+        self.finished = finished
+
+    def ids(self, index):
+        return index.status.get(self.finished, set())
+
+    def sql(self):
+        return 'done = ?', [int(self.finished)]
+
+    def matches(self, task):
+        return bool(task.finished) == self.finished
+
+
+class Priority(Where):
+    def __init__(self, priority):
+        self.priority = priority
+
+    def ids(self, index):
+        return index.priority.get(self.priority, set())
+
+    def sql(self):
+        return 'priority = ?', [self.priority]
+
+    def matches(self, task):
+        return task.priority == self.priority
+
+
+class Due(Where):
+    # start и end — ordinal дат включительно, None — без ограничения
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+
+    def ids(self, index):
+        return index.due_between(self.start, self.end)
+
+    def sql(self):
+        clauses, params = ['due_ord IS NOT NULL'], []
+        if self.start is not None:
+            clauses.append('due_ord >= ?')
+            params.append(self.start)
+        if self.end is not None:
+            clauses.append('due_ord <= ?')
+            params.append(self.end)
+        return ' AND '.join(clauses), params
+
+    def matches(self, task):
+        ordinal = date_ordinal(task.deadline)
+        return (ordinal is not None and (self.start is None or ordinal >= self.start)
+                and (self.end is None or ordinal <= self.end))
+
+
+class And(Where):
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def ids(self, index):
+        # пересечение начинается с самого маленького множества
+        sets = sorted((part.ids(index) for part in self.parts), key=len)
+        if not sets:
+            return index.all_ids()
+        return sets[0].intersection(*sets[1:])
+
+    def sql(self):
+        return join_sql(self.parts, ' AND ', '1')
+
+    def matches(self, task):
+        return all(part.matches(task) for part in self.parts)
+
+
+class Or(Where):
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def ids(self, index):
+        return set().union(*(part.ids(index) for part in self.parts))
+
+    def sql(self):
+        return join_sql(self.parts, ' OR ', '0')
+
+    def matches(self, task):
+        return any(part.matches(task) for part in self.parts)
+
+
+def join_sql(parts, operator, empty):
+    if not parts:
+        return empty, []
+    clauses, params = [], []
+    for part in parts:
+        clause, part_params = part.sql()
+        clauses.append(f'({clause})')
+        params += part_params
+    return operator.join(clauses), params
+
+
+def today_ordinal():
+    return datetime.now().toordinal()
+
+
+def overdue(today=None):
+    today = today_ordinal() if today is None else today
+    return Status(False) & Due(end=today - 1)
+
+
+def due_this_week(today=None):
+    # с сегодняшнего дня по воскресенье текущей недели
+    today = today_ordinal() if today is None else today
+    return Due(today, today + 6 - (today - 1) % 7)
+
+
+def due_before(ordinal):
+    return Due(end=ordinal - 1)
+
+
+def run_query(index, where=None, order=None, limit=None, offset=0):
+    # Возвращает задачи, отобранные по индексам; order — None (по id),
+    # 'deadline' или 'priority' (затем по сроку). Пока задачи не загружены,
+    # а хранилище умеет запросы (SQLite), отбор идёт запросом к нему по
+    # индексам базы, а не загрузкой всей коллекции.
+    repo = index.repo
+    if where is not None and not repo.loaded() and repo.queryable():
+        clause, params = where.sql()
+        return take(repo.query(where.matches, clause, params), task_sort_key(order), limit, offset)
+    items = index.ensure()
+    ids = index.all_ids() if where is None else where.ids(index)
+    return [items[task_id] for task_id in take(ids, index.sort_key(order), limit, offset)]
+
+
+def take(values, key, limit, offset):
+    if limit is not None and limit + offset < len(values):
+        ordered = heapq.nsmallest(limit + offset, values, key=key)
+    else:
+        ordered = sorted(values, key=key)
+    return ordered[offset:] if limit is None else ordered[offset:offset + limit]
+
+
+def task_sort_key(order):
+    # то же, что TaskIndex.sort_key, но по самим задачам
+    def deadline(task):
+        ordinal = date_ordinal(task.deadline)
+        return NO_DEADLINE if ordinal is None else ordinal
+    if order == 'deadline':
+        return lambda task: (deadline(task), task.id)
+    if order == 'priority':
+        return lambda task: (PRIORITY_RANK.get(task.priority, len(PRIORITY_RANK)), deadline(task), task.id)
+    return lambda task: task.id